@@ -219,7 +219,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module cf
     cf.r_par_max = args.rp_max
@@ -252,7 +252,8 @@ def main():
                                                   cosmo,
                                                   max_num_spec=args.nspec,
                                                   no_project=args.no_project,
-                                                  from_image=args.from_image)
+                                                  from_image=args.from_image,
+                                                  nproc=args.nproc)
     del z_max
     cf.data = data
     cf.num_data = num_data
@@ -281,7 +282,8 @@ def main():
             cosmo,
             max_num_spec=args.nspec,
             no_project=args.no_project,
-            from_image=args.from_image)
+            from_image=args.from_image,
+            nproc=args.nproc)
         del z_max2
         cf.data2 = data2
         cf.num_data2 = num_data2
@@ -138,7 +138,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in cf
     cf.nside = args.nside
@@ -163,7 +163,8 @@ def main():
                                                   args.z_ref,
                                                   cosmo=None,
                                                   max_num_spec=args.nspec,
-                                                  no_project=args.no_project)
+                                                  no_project=args.no_project,
+                                                  nproc=args.nproc)
     cf.data = data
     cf.num_data = num_data
     del z_min, z_max
@@ -181,7 +182,8 @@ def main():
             args.z_ref,
             cosmo=None,
             max_num_spec=args.nspec,
-            no_project=args.no_project)
+            no_project=args.no_project,
+            nproc=args.nproc)
         cf.data2 = data2
         cf.num_data2 = num_data2
         del z_min2, z_max2
@@ -197,7 +199,8 @@ def main():
             args.z_ref,
             cosmo=None,
             max_num_spec=args.nspec,
-            no_project=args.no_project)
+            no_project=args.no_project,
+            nproc=args.nproc)
         cf.data2 = data2
         cf.num_data2 = num_data2
         del z_min2, z_max2
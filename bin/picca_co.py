@@ -192,7 +192,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module co
     co.r_par_max = args.rp_max
@@ -9,7 +9,6 @@ import sys
 import os
 import time
 import multiprocessing
-from multiprocessing import Pool
 import argparse
 import fitsio
 import numpy as np
@@ -24,14 +23,48 @@ from picca.utils import userprint
 def cont_fit(forests):
     """ Computes the quasar continua for all the forests in data
 
+    Only the results of the fit are sent back, so that the forests do not have
+    to be pickled again when running in a pool of processes.
+
     Args:
         forests: a list of forest instances
     Returns:
-        the list of forests after having computed their quasar continua
+        the list of (cont, p0, p1, bad_cont) after having computed the
+        quasar continua of the forests
     """
     for forest in forests:
         forest.cont_fit()
-    return forests
+    return [(forest.cont, forest.p0, forest.p1, forest.bad_cont)
+            for forest in forests]
+
+
+def tabulate_on_grid(function):
+    """Tabulates a function of the observed wavelength on the forest grid.
+
+    Forests are always rebinned onto the grid
+    Forest.log_lambda_min + i * Forest.delta_log_lambda, so functions of the
+    observed wavelength (var_lss, eta, fudge, the stacked delta) only need to
+    be evaluated once per grid point. Evaluating the returned function then
+    only requires finding the grid index.
+
+    Args:
+        function: function
+            Function of the logarithm of the observed wavelength (e.g. an
+            interp1d instance)
+
+    Returns:
+        A function returning the tabulated values for points on the grid
+    """
+    log_lambda = (Forest.log_lambda_min +
+                  np.arange(Forest.get_num_bins()) * Forest.delta_log_lambda)
+    table = function(log_lambda)
+
+    def get_tabulated(log_lambda_eval):
+        index = ((log_lambda_eval - Forest.log_lambda_min) /
+                 Forest.delta_log_lambda + 0.5).astype(int)
+        return table[np.clip(index, 0, table.size - 1)]
+
+    return get_tabulated
 
 
 def get_metadata(data):
@@ -100,14 +133,13 @@ def get_delta_from_forest(forest,
         mean_expected_flux_frac = forest.mean_expected_flux_frac
     else:
         mean_expected_flux_frac = forest.cont * stack_delta
-    delta = forest.flux / mean_expected_flux_frac - 1.
-    var_pipe = 1. / forest.ivar / mean_expected_flux_frac**2
-    variance = eta * var_pipe + var_lss + fudge / var_pipe
-    weights = 1. / variance
+    (delta, weights, ivar,
+     inv_mean_expected_flux_frac) = prep_del.compute_delta(
+         forest.flux, forest.ivar, mean_expected_flux_frac, eta, var_lss,
+         fudge)
     exposures_diff = forest.exposures_diff
     if forest.exposures_diff is not None:
-        exposures_diff /= mean_expected_flux_frac
-    ivar = forest.ivar / (eta + (eta == 0)) * (mean_expected_flux_frac**2)
+        exposures_diff *= inv_mean_expected_flux_frac
 
     forest.delta = delta
     forest.weights = weights
@@ -422,18 +454,21 @@ def main():
     log_lambda_rest_frame_temp = (
         Forest.log_lambda_min_rest_frame + np.arange(2) *
         (Forest.log_lambda_max_rest_frame - Forest.log_lambda_min_rest_frame))
-    Forest.get_var_lss = interp1d(log_lambda_temp,
-                                  0.2 + np.zeros(2),
-                                  fill_value="extrapolate",
-                                  kind="nearest")
-    Forest.get_eta = interp1d(log_lambda_temp,
-                              np.ones(2),
-                              fill_value="extrapolate",
-                              kind="nearest")
-    Forest.get_fudge = interp1d(log_lambda_temp,
-                                np.zeros(2),
-                                fill_value="extrapolate",
-                                kind="nearest")
+    Forest.get_var_lss = tabulate_on_grid(
+        interp1d(log_lambda_temp,
+                 0.2 + np.zeros(2),
+                 fill_value="extrapolate",
+                 kind="nearest"))
+    Forest.get_eta = tabulate_on_grid(
+        interp1d(log_lambda_temp,
+                 np.ones(2),
+                 fill_value="extrapolate",
+                 kind="nearest"))
+    Forest.get_fudge = tabulate_on_grid(
+        interp1d(log_lambda_temp,
+                 np.zeros(2),
+                 fill_value="extrapolate",
+                 kind="nearest"))
     Forest.get_mean_cont = interp1d(log_lambda_rest_frame_temp,
                                     1 + np.zeros(2))
 
@@ -486,7 +521,8 @@ def main():
                                          best_obs=args.best_obs,
                                          single_exp=args.single_exp,
                                          pk1d=args.delta_format,
-                                         spall=args.spall)
+                                         spall=args.spall,
+                                         nproc=args.nproc)
 
     #-- Add order info
     for pix in data:
@@ -625,8 +661,12 @@ def main():
         sort = pixels.argsort()
         sorted_data = [data[k] for k in pixels[sort]]
         data_fit_cont = pool.map(cont_fit, sorted_data)
-        for index, healpix in enumerate(pixels[sort]):
-            data[healpix] = data_fit_cont[index]
+        for forests, fit_results in zip(sorted_data, data_fit_cont):
+            for forest, (cont, p0, p1, bad_cont) in zip(forests, fit_results):
+                forest.cont = cont
+                forest.p0 = p0
+                forest.p1 = p1
+                forest.bad_cont = bad_cont
 
         userprint(
             f"Continuum fitting: ending iteration {iteration} of {num_iterations}"
@@ -653,18 +693,21 @@ def main():
                      data, (args.eta_min, args.eta_max),
                      (args.vlss_min, args.vlss_max))
                 w = num_pixels > 0
-                Forest.get_eta = interp1d(log_lambda[w],
-                                          eta[w],
-                                          fill_value="extrapolate",
-                                          kind="nearest")
-                Forest.get_var_lss = interp1d(log_lambda[w],
-                                              var_lss[w],
-                                              fill_value="extrapolate",
-                                              kind="nearest")
-                Forest.get_fudge = interp1d(log_lambda[w],
-                                            fudge[w],
-                                            fill_value="extrapolate",
-                                            kind="nearest")
+                Forest.get_eta = tabulate_on_grid(
+                    interp1d(log_lambda[w],
+                             eta[w],
+                             fill_value="extrapolate",
+                             kind="nearest"))
+                Forest.get_var_lss = tabulate_on_grid(
+                    interp1d(log_lambda[w],
+                             var_lss[w],
+                             fill_value="extrapolate",
+                             kind="nearest"))
+                Forest.get_fudge = tabulate_on_grid(
+                    interp1d(log_lambda[w],
+                             fudge[w],
+                             fill_value="extrapolate",
+                             kind="nearest"))
             else:
                 num_bins = 10  # this value is arbitrary
                 log_lambda = (
@@ -696,18 +739,21 @@ def main():
                 count = np.zeros((num_bins, num_bins))
                 num_qso = np.zeros((num_bins, num_bins))
 
-                Forest.get_eta = interp1d(log_lambda,
-                                          eta,
-                                          fill_value='extrapolate',
-                                          kind='nearest')
-                Forest.get_var_lss = interp1d(log_lambda,
-                                              var_lss,
-                                              fill_value='extrapolate',
-                                              kind='nearest')
-                Forest.get_fudge = interp1d(log_lambda,
-                                            fudge,
-                                            fill_value='extrapolate',
-                                            kind='nearest')
+                Forest.get_eta = tabulate_on_grid(
+                    interp1d(log_lambda,
+                             eta,
+                             fill_value='extrapolate',
+                             kind='nearest'))
+                Forest.get_var_lss = tabulate_on_grid(
+                    interp1d(log_lambda,
+                             var_lss,
+                             fill_value='extrapolate',
+                             kind='nearest'))
+                Forest.get_fudge = tabulate_on_grid(
+                    interp1d(log_lambda,
+                             fudge,
+                             fill_value='extrapolate',
+                             kind='nearest'))
 
     ### Read metadata from forests and export it
     if not args.metadata is None:
@@ -746,10 +792,11 @@ def main():
     results.close()
 
     ### Compute deltas and format them
-    get_stack_delta = interp1d(stack_log_lambda[stack_weight > 0.],
-                               stack_delta[stack_weight > 0.],
-                               kind="nearest",
-                               fill_value="extrapolate")
+    get_stack_delta = tabulate_on_grid(
+        interp1d(stack_log_lambda[stack_weight > 0.],
+                 stack_delta[stack_weight > 0.],
+                 kind="nearest",
+                 fill_value="extrapolate"))
     deltas = {}
     data_bad_cont = []
     for healpix in sorted(data.keys()):
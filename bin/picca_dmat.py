@@ -7,7 +7,7 @@ Bourboux et al. 2020 (In prep) to compute the distortion matrix
 import time
 import argparse
 import multiprocessing
-from multiprocessing import Pool, Lock, cpu_count, Value
+from multiprocessing import Lock, cpu_count, Value
 import numpy as np
 import fitsio
 
@@ -227,7 +227,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     userprint("nproc", args.nproc)
 
@@ -264,7 +264,8 @@ def main():
                                                   cf.z_ref,
                                                   cosmo,
                                                   max_num_spec=args.nspec,
-                                                  no_project=args.no_project)
+                                                  no_project=args.no_project,
+                                                  nproc=args.nproc)
     del z_max
     cf.data = data
     cf.num_data = num_data
@@ -292,7 +293,8 @@ def main():
             cf.z_ref,
             cosmo,
             max_num_spec=args.nspec,
-            no_project=args.no_project)
+            no_project=args.no_project,
+            nproc=args.nproc)
         del z_max2
         cf.data2 = data2
         cf.num_data2 = num_data2
@@ -316,34 +318,28 @@ def main():
     if args.nproc > 1:
         context = multiprocessing.get_context('fork')
         pool = context.Pool(processes=args.nproc)
-        dmat_data = pool.map(calc_dmat, sorted(cpu_data.values()))
+        dmat_data = utils.sum_partial_results(
+            pool.imap(calc_dmat, sorted(cpu_data.values())))
         pool.close()
     elif args.nproc == 1:
-        dmat_data = map(calc_dmat, sorted(cpu_data.values()))
-        dmat_data = list(dmat_data)
+        dmat_data = utils.sum_partial_results(
+            map(calc_dmat, sorted(cpu_data.values())))
 
     t2 = time.time()
     userprint(f'picca_dmat.py - Time computing distortion matrix: {(t2-t1)/60:.3f} minutes')
 
 
-    # merge the results from different CPUs
-    dmat_data = np.array(dmat_data)
-    weights_dmat = dmat_data[:, 0].sum(axis=0)
-    dmat = dmat_data[:, 1].sum(axis=0)
-    r_par = dmat_data[:, 2].sum(axis=0)
-    r_trans = dmat_data[:, 3].sum(axis=0)
-    z = dmat_data[:, 4].sum(axis=0)
-    weights = dmat_data[:, 5].sum(axis=0)
-    num_pairs = dmat_data[:, 6].sum(axis=0)
-    num_pairs_used = dmat_data[:, 7].sum(axis=0)
+    # the results from different CPUs are merged as they arrive
+    (weights_dmat, dmat, r_par, r_trans, z, weights, num_pairs,
+     num_pairs_used) = dmat_data
 
-    # normalize values
+    # normalize values (in place, without fancy-indexed temporaries)
     w = weights > 0.
-    r_par[w] /= weights[w]
-    r_trans[w] /= weights[w]
-    z[w] /= weights[w]
-    w = weights_dmat > 0
-    dmat[w] /= weights_dmat[w, None]
+    np.divide(r_par, weights, out=r_par, where=w)
+    np.divide(r_trans, weights, out=r_trans, where=w)
+    np.divide(z, weights, out=z, where=w)
+    w = weights_dmat > 0.
+    np.divide(dmat, weights_dmat[:, None], out=dmat, where=w[:, None])
 
     # save results
     results = fitsio.FITS(args.out, 'rw', clobber=True)
@@ -7,8 +7,9 @@ Bourboux et al. 2020 (In prep) to compute the distortion matrix
 """
 import time
 import argparse
+import gc
 import multiprocessing
-from multiprocessing import Pool, Lock, cpu_count, Value
+from multiprocessing import Lock, cpu_count, Value
 from functools import partial
 import numpy as np
 import fitsio
@@ -258,7 +259,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     userprint("nproc", args.nproc)
 
@@ -299,7 +300,8 @@ def main():
                                                   cf.alpha,
                                                   cf.z_ref,
                                                   cf.cosmo,
-                                                  max_num_spec=args.nspec)
+                                                  max_num_spec=args.nspec,
+                                                  nproc=args.nproc)
     del z_max
     cf.data = data
     cf.num_data = num_data
@@ -329,7 +331,8 @@ def main():
             cf.alpha2,
             cf.z_ref,
             cf.cosmo,
-            max_num_spec=args.nspec)
+            max_num_spec=args.nspec,
+            nproc=args.nproc)
         del z_max2
         cf.data2 = data2
         cf.num_data2 = num_data2
@@ -343,12 +346,9 @@ def main():
 
     cf.counter = Value('i', 0)
     cf.lock = Lock()
-    cpu_data = {}
-    for index, healpix in enumerate(sorted(list(data.keys()))):
-        num_processor = index % args.nproc
-        if not num_processor in cpu_data:
-            cpu_data[num_processor] = []
-        cpu_data[num_processor].append(healpix)
+    cpu_data = utils.distribute_healpixs(data, args.nproc)
+    # the list of tasks is the same for all the metal pairs, build it once
+    sorted_cpu_data = sorted(cpu_data.values())
 
     # intiialize arrays to store the results for the different metal absorption
     dmat_all = []
@@ -372,6 +372,16 @@ def main():
     if cf.x_correlation:
         userprint("abs_igm2 = {}".format(abs_igm_2))
 
+    # the pool is created once and reused for all the metal pairs, so that the
+    # workers (and their copy of the data) are only forked once
+    if args.nproc > 1:
+        # move the data to the permanent generation of the garbage collector
+        # so that the forked workers do not write to (and therefore copy) the
+        # memory pages holding it when they collect
+        gc.freeze()
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(processes=args.nproc)
+
     # loop over metals
     for index1, abs_igm1 in enumerate(abs_igm):
         index0 = index1
@@ -385,36 +395,25 @@ def main():
                                               abs_igm2)
             userprint("")
 
-            # compute the distortion matrix
+            # compute the distortion matrix and merge the results from
+            # different CPUs as they arrive
             if args.nproc > 1:
-                context = multiprocessing.get_context('fork')
-                pool = context.Pool(processes=args.nproc)
-                dmat_data = pool.map(calc_metal_dmat_wrapper,
-                                     sorted(cpu_data.values()))
-                pool.close()
+                dmat_data = utils.sum_partial_results(
+                    pool.imap(calc_metal_dmat_wrapper, sorted_cpu_data))
             elif args.nproc == 1:
-                dmat_data = map(calc_metal_dmat_wrapper,
-                                sorted(cpu_data.values()))
-                dmat_data = list(dmat_data)
-
-            # merge the results from different CPUs
-            dmat_data = np.array(dmat_data)
-            weights_dmat = dmat_data[:, 0].sum(axis=0)
-            dmat = dmat_data[:, 1].sum(axis=0)
-            r_par = dmat_data[:, 2].sum(axis=0)
-            r_trans = dmat_data[:, 3].sum(axis=0)
-            z = dmat_data[:, 4].sum(axis=0)
-            weights = dmat_data[:, 5].sum(axis=0)
-            num_pairs = dmat_data[:, 6].sum(axis=0)
-            num_pairs_used = dmat_data[:, 7].sum(axis=0)
-
-            # normalize_values
+                dmat_data = utils.sum_partial_results(
+                    map(calc_metal_dmat_wrapper, sorted_cpu_data))
+
+            (weights_dmat, dmat, r_par, r_trans, z, weights, num_pairs,
+             num_pairs_used) = dmat_data
+
+            # normalize_values (in place, without fancy-indexed temporaries)
             w = weights > 0
-            r_par[w] /= weights[w]
-            r_trans[w] /= weights[w]
-            z[w] /= weights[w]
+            np.divide(r_par, weights, out=r_par, where=w)
+            np.divide(r_trans, weights, out=r_trans, where=w)
+            np.divide(z, weights, out=z, where=w)
             w = weights_dmat > 0
-            dmat[w, :] /= weights_dmat[w, None]
+            np.divide(dmat, weights_dmat[:, None], out=dmat, where=w[:, None])
 
             # add these results to the list ofor the different metal absorption
             dmat_all.append(dmat)
@@ -426,6 +425,9 @@ def main():
             num_pairs_all.append(num_pairs)
             num_pairs_used_all.append(num_pairs_used)
 
+    if args.nproc > 1:
+        pool.close()
+
     t2 = time.time()
     userprint(f'picca_metal_dmat.py - Time computing all metal matrices : {(t2-t1)/60:.3f} minutes')
 
@@ -500,13 +502,13 @@ def main():
         }
         ]
 
-    len_names = np.array([len(name) for name in names]).max()
+    len_names = max(len(name) for name in names)
     names = np.array(names, dtype='S' + str(len_names))
     results.write(
         [
             np.array(num_pairs_all),
             np.array(num_pairs_used_all),
-            np.array(names)
+            names
         ],
         names=['NPALL', 'NPUSED', 'ABS_IGM'],
         header=header,
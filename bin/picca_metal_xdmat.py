@@ -9,7 +9,7 @@ import time
 import argparse
 from functools import partial
 import multiprocessing
-from multiprocessing import Pool, Lock, cpu_count, Value
+from multiprocessing import Lock, cpu_count, Value
 import numpy as np
 import fitsio
 
@@ -248,7 +248,7 @@ def main():
 
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module xcf
     xcf.r_par_max = args.rp_max
@@ -286,7 +286,8 @@ def main():
                                                   args.z_evol_del,
                                                   args.z_ref,
                                                   cosmo,
-                                                  max_num_spec=args.nspec)
+                                                  max_num_spec=args.nspec,
+                                                  nproc=args.nproc)
 
     xcf.data = data
     xcf.num_data = num_data
@@ -340,34 +341,28 @@ def main():
         calc_metal_dmat_wrapper = partial(calc_metal_dmat, abs_igm)
         userprint("")
 
+        # compute the distortion matrix and merge the results from
+        # different CPUs as they arrive
         if args.nproc > 1:
             context = multiprocessing.get_context('fork')
             pool = context.Pool(processes=args.nproc)
-            dmat_data = pool.map(calc_metal_dmat_wrapper,
-                                 sorted(cpu_data.values()))
+            dmat_data = utils.sum_partial_results(
+                pool.imap(calc_metal_dmat_wrapper, sorted(cpu_data.values())))
             pool.close()
         elif args.nproc == 1:
-            dmat_data = map(calc_metal_dmat_wrapper, sorted(cpu_data.values()))
-            dmat_data = list(dmat_data)
-
-        # merge the results from different CPUs
-        dmat_data = np.array(dmat_data)
-        weights_dmat = dmat_data[:, 0].sum(axis=0)
-        dmat = dmat_data[:, 1].sum(axis=0)
-        r_par = dmat_data[:, 2].sum(axis=0)
-        r_trans = dmat_data[:, 3].sum(axis=0)
-        z = dmat_data[:, 4].sum(axis=0)
-        weights = dmat_data[:, 5].sum(axis=0)
-
-        # normalize_values
-        w = weights > 0
-        r_par[w] /= weights[w]
-        r_trans[w] /= weights[w]
-        z[w] /= weights[w]
-        num_pairs = dmat_data[:, 6].sum(axis=0)
-        num_pairs_used = dmat_data[:, 7].sum(axis=0)
-        w = weights_dmat > 0
-        dmat[w, :] /= weights_dmat[w, None]
+            dmat_data = utils.sum_partial_results(
+                map(calc_metal_dmat_wrapper, sorted(cpu_data.values())))
+
+        (weights_dmat, dmat, r_par, r_trans, z, weights, num_pairs,
+         num_pairs_used) = dmat_data
+
+        # normalize_values (in place, without fancy-indexed temporaries)
+        w = weights > 0.
+        np.divide(r_par, weights, out=r_par, where=w)
+        np.divide(r_trans, weights, out=r_trans, where=w)
+        np.divide(z, weights, out=z, where=w)
+        w = weights_dmat > 0.
+        np.divide(dmat, weights_dmat[:, None], out=dmat, where=w[:, None])
 
         # add these results to the list ofor the different metal absorption
         dmat_all.append(dmat)
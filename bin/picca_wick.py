@@ -5,8 +5,9 @@ The wick covariance is computed as explained in Delubac et al. 2015
 """
 import sys
 import argparse
+import gc
 import multiprocessing
-from multiprocessing import Pool, Lock, cpu_count, Value
+from multiprocessing import Lock, cpu_count, Value
 import fitsio
 import numpy as np
 from scipy.interpolate import interp1d
@@ -35,6 +36,42 @@ def calc_wick_terms(healpixs):
     return wick_data
 
 
+def get_nearest_lookup(x_min, delta_x, values, valid):
+    """Builds a fast nearest-neighbour interpolator for values tabulated on a
+    regular grid.
+
+    The nearest valid value is precomputed for every point of the grid, so
+    that evaluating the function only requires rounding to the closest grid
+    index. This is equivalent to `interp1d(..., kind='nearest',
+    fill_value='extrapolate')` over the valid points when evaluated on the
+    grid.
+
+    Args:
+        x_min: float
+            First point of the grid
+        delta_x: float
+            Spacing of the grid
+        values: array of floats
+            Tabulated values
+        valid: array of bool
+            Mask selecting the tabulated values that can be used
+
+    Returns:
+        A function returning the nearest valid value for an array of points
+    """
+    x = x_min + delta_x * np.arange(values.size)
+    table = interp1d(x[valid],
+                     values[valid],
+                     kind='nearest',
+                     fill_value='extrapolate')(x)
+
+    def get_nearest(x_eval):
+        index = np.rint((x_eval - x_min) / delta_x).astype(int)
+        return table[np.clip(index, 0, table.size - 1)]
+
+    return get_nearest
+
+
 def main():
     # pylint: disable-msg=too-many-locals,too-many-branches,too-many-statements
     """Computes the wick covariance for the auto-correlation of forests"""
@@ -257,7 +294,7 @@ def main():
     args = parser.parse_args()
 
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     userprint("nproc", args.nproc)
 
@@ -294,7 +331,8 @@ def main():
                                                   cf.alpha,
                                                   cf.z_ref,
                                                   cosmo,
-                                                  max_num_spec=args.nspec)
+                                                  max_num_spec=args.nspec,
+                                                  nproc=args.nproc)
     for deltas in data.values():
         for delta in deltas:
             delta.fname = 'D1'
@@ -321,21 +359,14 @@ def main():
         delta_log_lambda = header['DLL']
         num_pairs_variance_1d = hdul[1]['nv1d'][:]
         variance_1d = hdul[1]['v1d'][:]
-        log_lambda = (log_lambda_min +
-                      delta_log_lambda * np.arange(len(variance_1d)))
-        cf.get_variance_1d[fname] = interp1d(
-            log_lambda[num_pairs_variance_1d > 0],
-            variance_1d[num_pairs_variance_1d > 0],
-            kind='nearest',
-            fill_value='extrapolate')
+        cf.get_variance_1d[fname] = get_nearest_lookup(
+            log_lambda_min, delta_log_lambda, variance_1d,
+            num_pairs_variance_1d > 0)
 
         num_pairs1d = hdul[1]['nb1d'][:]
         xi_1d = hdul[1]['c1d'][:]
-        cf.xi_1d[fname] = interp1d(
-            (log_lambda - log_lambda_min)[num_pairs1d > 0],
-            xi_1d[num_pairs1d > 0],
-            kind='nearest',
-            fill_value='extrapolate')
+        cf.xi_1d[fname] = get_nearest_lookup(0., delta_log_lambda, xi_1d,
+                                             num_pairs1d > 0)
         hdul.close()
 
     # Load correlation functions
@@ -384,7 +415,8 @@ def main():
             cf.alpha2,
             cf.z_ref,
             cosmo,
-            max_num_spec=args.nspec)
+            max_num_spec=args.nspec,
+            nproc=args.nproc)
         for deltas in data.values():
             for delta in deltas:
                 delta.fname = 'D2'
@@ -403,33 +435,24 @@ def main():
     cf.counter = Value('i', 0)
     cf.lock = Lock()
 
-    cpu_data = {}
-    for index, healpix in enumerate(sorted(data)):
-        num_processor = index % args.nproc
-        if not num_processor in cpu_data:
-            cpu_data[num_processor] = []
-        cpu_data[num_processor].append(healpix)
+    cpu_data = utils.distribute_healpixs(data, args.nproc)
 
     # compute the covariance matrix
+    # move the data to the permanent generation of the garbage collector so
+    # that the forked workers do not write to (and therefore copy) the memory
+    # pages holding it when they collect
+    gc.freeze()
     context = multiprocessing.get_context('fork')
     pool = context.Pool(processes=min(args.nproc, len(cpu_data.values())))
     userprint(" \nStarting\n")
-    wick_data = pool.map(calc_wick_terms, sorted(cpu_data.values()))
+    # merge the results from the different CPUs as they arrive
+    wick_data = utils.sum_partial_results(
+        pool.imap(calc_wick_terms, sorted(cpu_data.values())))
     userprint(" \nFinished\n")
     pool.close()
 
-    # merge the results from the different CPUs
-    wick_data = np.array(wick_data)
-    weights_wick = wick_data[:, 0].sum(axis=0)
-    num_pairs_wick = wick_data[:, 1].sum(axis=0)
-    num_pairs = wick_data[:, 2].sum(axis=0)
-    num_pairs_used = wick_data[:, 3].sum(axis=0)
-    t1 = wick_data[:, 4].sum(axis=0)
-    t2 = wick_data[:, 5].sum(axis=0)
-    t3 = wick_data[:, 6].sum(axis=0)
-    t4 = wick_data[:, 7].sum(axis=0)
-    t5 = wick_data[:, 8].sum(axis=0)
-    t6 = wick_data[:, 9].sum(axis=0)
+    (weights_wick, num_pairs_wick, num_pairs, num_pairs_used, t1, t2, t3, t4,
+     t5, t6) = wick_data
     weights = weights_wick * weights_wick[:, None]
     w = weights > 0.
     t1[w] /= weights[w]
@@ -238,7 +238,7 @@ def main():
 
     args = parser.parse_args()
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module xcf
     xcf.r_par_max = args.rp_max
@@ -286,7 +286,8 @@ def main():
                                                   cosmo=cosmo,
                                                   max_num_spec=args.nspec,
                                                   no_project=args.no_project,
-                                                  from_image=args.from_image)
+                                                  from_image=args.from_image,
+                                                  nproc=args.nproc)
     xcf.data = data
     xcf.num_data = num_data
     userprint("")
@@ -176,7 +176,7 @@ def main():
 
     args = parser.parse_args()
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module xcf
     xcf.r_par_min = args.wr_min
@@ -199,7 +199,8 @@ def main():
                                                   args.z_ref,
                                                   cosmo=None,
                                                   max_num_spec=args.nspec,
-                                                  no_project=args.no_project)
+                                                  no_project=args.no_project,
+                                                  nproc=args.nproc)
     xcf.data = data
     xcf.num_data = num_data
     sys.stderr.write("\n")
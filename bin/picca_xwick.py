@@ -6,7 +6,7 @@ The wick covariance is computed as explained in Delubac et al. 2015
 import sys
 import argparse
 import multiprocessing
-from multiprocessing import Pool, Lock, cpu_count, Value
+from multiprocessing import Lock, cpu_count, Value
 import fitsio
 import numpy as np
 from scipy.interpolate import interp1d
@@ -240,7 +240,7 @@ def main():
 
     args = parser.parse_args()
     if args.nproc is None:
-        args.nproc = cpu_count() // 2
+        args.nproc = max(1, cpu_count() // 2)
 
     # setup variables in module xcf
     xcf.r_par_min = args.rp_min
@@ -275,7 +275,8 @@ def main():
                                                   args.z_evol_del,
                                                   args.z_ref,
                                                   cosmo=cosmo,
-                                                  max_num_spec=args.nspec)
+                                                  max_num_spec=args.nspec,
+                                                  nproc=args.nproc)
     for deltas in data.values():
         for delta in deltas:
             delta.fname = 'D1'
@@ -380,21 +381,14 @@ def main():
     context = multiprocessing.get_context('fork')
     pool = context.Pool(processes=min(args.nproc, len(cpu_data.values())))
     userprint(" \nStarting\n")
-    wick_data = pool.map(calc_wick_terms, sorted(cpu_data.values()))
+    # merge the results from the different CPUs as they arrive
+    wick_data = utils.sum_partial_results(
+        pool.imap(calc_wick_terms, sorted(cpu_data.values())))
     userprint(" \nFinished\n")
     pool.close()
 
-    wick_data = np.array(wick_data)
-    weights_wick = wick_data[:, 0].sum(axis=0)
-    num_pairs_wick = wick_data[:, 1].sum(axis=0)
-    npairs = wick_data[:, 2].sum(axis=0)
-    npairs_used = wick_data[:, 3].sum(axis=0)
-    t1 = wick_data[:, 4].sum(axis=0)
-    t2 = wick_data[:, 5].sum(axis=0)
-    t3 = wick_data[:, 6].sum(axis=0)
-    t4 = wick_data[:, 7].sum(axis=0)
-    t5 = wick_data[:, 8].sum(axis=0)
-    t6 = wick_data[:, 9].sum(axis=0)
+    (weights_wick, num_pairs_wick, npairs, npairs_used, t1, t2, t3, t4, t5,
+     t6) = wick_data
     weights = weights_wick * weights_wick[:, None]
     w = weights > 0.
     t1[w] /= weights[w]
@@ -8,6 +8,7 @@ This module provides several functions:
     - compute_dmat
     - compute_dmat_forest_pairs
     - compute_metal_dmat
+    - compute_metal_dmat_forest_pairs
     - compute_xi_1d
     - compute_xi_1d_cross
     - compute_wick_terms
@@ -15,11 +16,13 @@ This module provides several functions:
     - compute_wickT45_pairs
 See the respective docstrings for more details
 """
+from itertools import compress
 import numpy as np
 from healpy import query_disc
 from numba import jit, int32
 
 from picca import constants
+from picca.data import QSO
 from picca.utils import userprint
 
 num_bins_r_par = None
@@ -78,35 +81,46 @@ def fill_neighs(healpixs):
         healpixs: array of ints
             List of healpix numbers
     """
+    other_data = data if data2 is None else data2
+    # coordinates of the objects in each healpix, gathered once per healpix
+    # and shared by all the deltas querying it
+    healpix_coords = {}
+    healpix_thingids = {}
     for healpix in healpixs:
         for delta in data[healpix]:
             healpix_neighbours = query_disc(
                 nside, [delta.x_cart, delta.y_cart, delta.z_cart],
                 ang_max,
                 inclusive=True)
-            if data2 is not None:
-                healpix_neighbours = [
-                    other_healpix for other_healpix in healpix_neighbours
-                    if other_healpix in data2
-                ]
-                neighbours = [
-                    other_delta for other_healpix in healpix_neighbours
-                    for other_delta in data2[other_healpix]
-                    if delta.thingid != other_delta.thingid
-                ]
-            else:
-                healpix_neighbours = [
-                    other_healpix for other_healpix in healpix_neighbours
-                    if other_healpix in data
-                ]
-                neighbours = [
-                    other_delta for other_healpix in healpix_neighbours
-                    for other_delta in data[other_healpix]
-                    if delta.thingid != other_delta.thingid
-                ]
-            ang = delta.get_angle_between(neighbours)
+            healpix_neighbours = [
+                other_healpix for other_healpix in healpix_neighbours
+                if other_healpix in other_data
+            ]
+            if len(healpix_neighbours) == 0:
+                delta.neighbours = []
+                continue
+            for other_healpix in healpix_neighbours:
+                if other_healpix not in healpix_coords:
+                    healpix_coords[other_healpix] = QSO.get_coordinates(
+                        other_data[other_healpix])
+                    healpix_thingids[other_healpix] = np.array([
+                        other_delta.thingid
+                        for other_delta in other_data[other_healpix]
+                    ])
+            w = np.concatenate([
+                healpix_thingids[other_healpix]
+                for other_healpix in healpix_neighbours
+            ]) != delta.thingid
+            neighbours = list(
+                compress((other_delta for other_healpix in healpix_neighbours
+                          for other_delta in other_data[other_healpix]), w))
+            ang = delta.get_angle_between(
+                np.concatenate([
+                    healpix_coords[other_healpix]
+                    for other_healpix in healpix_neighbours
+                ])[w])
             w = ang < ang_max
-            neighbours = np.array(neighbours)[w]
+            neighbours = list(compress(neighbours, w))
             if data2 is not None:
                 delta.neighbours = [
                     other_delta for other_delta in neighbours
@@ -422,7 +436,7 @@ def compute_dmat(healpixs):
             w = np.random.rand(len(delta1.neighbours)) > reject
             num_pairs += len(delta1.neighbours)
             num_pairs_used += w.sum()
-            for delta2 in np.array(delta1.neighbours)[w]:
+            for delta2 in compress(delta1.neighbours, w):
                 same_half_plate = ((delta1.plate == delta2.plate) and (
                     (delta1.fiberid <= 500 and delta2.fiberid <= 500) or
                     (delta1.fiberid > 500 and delta2.fiberid > 500)))
@@ -933,6 +947,11 @@ def compute_metal_dmat(healpixs, abs_igm1="LYA", abs_igm2="SiIII(1207)"):
     z_eff = np.zeros(num_model_bins_r_trans * num_model_bins_r_par)
     weight_eff = np.zeros(num_model_bins_r_trans * num_model_bins_r_par)
 
+    # in the auto-correlation of different absorbers, the pairs with the
+    # absorbers swapped between the two forests also contribute
+    add_swapped_pairs = (((not x_correlation) and (abs_igm1 != abs_igm2)) or
+                         (x_correlation and (lambda_abs == lambda_abs2)))
+
     num_pairs = 0
     num_pairs_used = 0
     for healpix in healpixs:
@@ -947,225 +966,186 @@ def compute_metal_dmat(healpixs, abs_igm1="LYA", abs_igm2="SiIII(1207)"):
             w = np.random.rand(len(delta1.neighbours)) > reject
             num_pairs += len(delta1.neighbours)
             num_pairs_used += w.sum()
-            for delta2 in np.array(delta1.neighbours)[w]:
-                r_comov1 = delta1.r_comov
-                dist_m1 = delta1.dist_m
-                z1_abs1 = (
-                    10**delta1.log_lambda / constants.ABSORBER_IGM[abs_igm1] -
-                    1)
-                r_comov1_abs1 = cosmo.get_r_comov(z1_abs1)
-                dist_m1_abs1 = cosmo.get_dist_m(z1_abs1)
-                weights1 = delta1.weights
-
-                # filter cases where the absorption from the metal is
-                # inconsistent with the quasar redshift
-                w = z1_abs1 < delta1.z_qso
-                r_comov1 = r_comov1[w]
-                dist_m1 = dist_m1[w]
-                weights1 = weights1[w]
-                r_comov1_abs1 = r_comov1_abs1[w]
-                dist_m1_abs1 = dist_m1_abs1[w]
-                z1_abs1 = z1_abs1[w]
+            if w.sum() == 0:
+                setattr(delta1, "neighbours", None)
+                continue
 
+            # the quantities of the first forest do not depend on the
+            # neighbour, compute them only once
+            forest1_abs1 = get_metal_forest(delta1, abs_igm1)
+            if add_swapped_pairs:
+                forest1_abs2 = get_metal_forest(delta1, abs_igm2)
+
+            for delta2 in compress(delta1.neighbours, w):
                 same_half_plate = ((delta1.plate == delta2.plate) and (
                     (delta1.fiberid <= 500 and delta2.fiberid <= 500) or
                     (delta1.fiberid > 500 and delta2.fiberid > 500)))
                 ang = delta1.get_angle_between(delta2)
-                r_comov2 = delta2.r_comov
-                dist_m2 = delta2.dist_m
-                z2_abs2 = (
-                    10**delta2.log_lambda / constants.ABSORBER_IGM[abs_igm2] -
-                    1)
-                r_comov2_abs2 = cosmo.get_r_comov(z2_abs2)
-                dist_m2_abs2 = cosmo.get_dist_m(z2_abs2)
-                weights2 = delta2.weights
 
-                # filter cases where the absorption from the metal is
-                # inconsistent with the quasar redshift
-                w = z2_abs2 < delta2.z_qso
-                r_comov2 = r_comov2[w]
-                dist_m2 = dist_m2[w]
-                weights2 = weights2[w]
-                r_comov2_abs2 = r_comov2_abs2[w]
-                dist_m2_abs2 = dist_m2_abs2[w]
-                z2_abs2 = z2_abs2[w]
-
-                # compute bins the pairs contribute to
-                r_par = (r_comov1[:, None] - r_comov2) * np.cos(ang / 2)
-                if not x_correlation:
-                    r_par = abs(r_par)
+                forest2_abs2 = get_metal_forest(delta2, abs_igm2)
+                compute_metal_dmat_forest_pairs(
+                    *forest1_abs1, *forest2_abs2, alpha_abs[abs_igm1],
+                    alpha_abs[abs_igm2], ang, same_half_plate, weights_dmat,
+                    dmat, r_par_eff, r_trans_eff, z_eff, weight_eff)
+
+                if add_swapped_pairs:
+                    forest2_abs1 = get_metal_forest(delta2, abs_igm1)
+                    compute_metal_dmat_forest_pairs(
+                        *forest1_abs2, *forest2_abs1, alpha_abs[abs_igm2],
+                        alpha_abs[abs_igm1], ang, same_half_plate,
+                        weights_dmat, dmat, r_par_eff, r_trans_eff, z_eff,
+                        weight_eff)
+            setattr(delta1, "neighbours", None)
 
-                r_trans = (dist_m1[:, None] + dist_m2) * np.sin(ang / 2)
-                weights12 = weights1[:, None] * weights2
+    dmat = dmat.reshape(num_bins_r_par * num_bins_r_trans,
+                        num_model_bins_r_par * num_model_bins_r_trans)
+    return (weights_dmat, dmat, r_par_eff, r_trans_eff, z_eff, weight_eff,
+            num_pairs, num_pairs_used)
 
-                bins_r_par = np.floor(
-                    (r_par - r_par_min) / (r_par_max - r_par_min) *
-                    num_bins_r_par).astype(int)
-                bins_r_trans = (r_trans / r_trans_max *
-                                num_bins_r_trans).astype(int)
 
-                if remove_same_half_plate_close_pairs and same_half_plate:
-                    weights12[abs(r_par) < (r_par_max - r_par_min) /
-                              num_bins_r_par] = 0.
+def get_metal_forest(delta, abs_igm):
+    """Computes the pixel quantities of a forest needed by the metal distortion
+    matrix.
 
-                bins = bins_r_trans + num_bins_r_trans * bins_r_par
-                w = ((bins_r_par < num_bins_r_par) &
-                     (bins_r_trans < num_bins_r_trans) & (bins_r_par >= 0))
-                rebin = np.bincount(bins[w], weights=weights12[w])
-                weights_dmat[:len(rebin)] += rebin
+    Pixels where the metal absorption would be redwards of the quasar are
+    discarded.
 
-                r_par_abs1_abs2 = (r_comov1_abs1[:, None] -
-                                   r_comov2_abs2) * np.cos(ang / 2)
+    Args:
+        delta: Delta
+            The forest
+        abs_igm: str
+            Name of the absorption in picca.constants defining the redshift of
+            the metal absorption
 
-                if not x_correlation:
-                    r_par_abs1_abs2 = abs(r_par_abs1_abs2)
-
-                r_trans_abs1_abs2 = (dist_m1_abs1[:, None] +
-                                     dist_m2_abs2) * np.sin(ang / 2)
-                z_weight_evol = (
-                    (1 + z1_abs1[:, None])**(alpha_abs[abs_igm1] - 1) *
-                    (1 + z2_abs2)**(alpha_abs[abs_igm2] - 1) / (1 + z_ref)
-                    **(alpha_abs[abs_igm1] + alpha_abs[abs_igm2] - 2))
-
-                model_bins_r_par = np.floor(
-                    (r_par_abs1_abs2 - r_par_min) / (r_par_max - r_par_min) *
-                    num_model_bins_r_par).astype(int)
-                model_bins_r_trans = (r_trans_abs1_abs2 / r_trans_max *
-                                      num_model_bins_r_trans).astype(int)
-                model_bins = (model_bins_r_trans +
-                              num_model_bins_r_trans * model_bins_r_par)
-                w &= ((model_bins_r_par < num_model_bins_r_par) &
-                      (model_bins_r_trans < num_model_bins_r_trans) &
-                      (model_bins_r_par >= 0))
-                rebin = np.bincount(
-                    (model_bins[w] +
-                     num_model_bins_r_par * num_model_bins_r_trans * bins[w]),
-                    weights=weights12[w] * z_weight_evol[w])
-                dmat[:len(rebin)] += rebin
-                rebin = np.bincount(model_bins[w],
-                                    weights=(r_par_abs1_abs2[w] * weights12[w] *
-                                             z_weight_evol[w]))
-                r_par_eff[:len(rebin)] += rebin
-                rebin = np.bincount(model_bins[w],
-                                    weights=(r_trans_abs1_abs2[w] *
-                                             weights12[w] * z_weight_evol[w]))
-                r_trans_eff[:len(rebin)] += rebin
-                rebin = np.bincount(
-                    model_bins[w],
-                    weights=((z1_abs1[:, None] + z2_abs2)[w] / 2 *
-                             weights12[w] * z_weight_evol[w]))
-                z_eff[:len(rebin)] += rebin
-                rebin = np.bincount(model_bins[w],
-                                    weights=weights12[w] * z_weight_evol[w])
-                weight_eff[:len(rebin)] += rebin
-
-                if (((not x_correlation) and (abs_igm1 != abs_igm2)) or
-                    (x_correlation and (lambda_abs == lambda_abs2))):
-                    r_comov1 = delta1.r_comov
-                    dist_m1 = delta1.dist_m
-                    weights1 = delta1.weights
-                    z1_abs2 = (10**delta1.log_lambda /
-                               constants.ABSORBER_IGM[abs_igm2] - 1)
-                    r_comov1_abs2 = cosmo.get_r_comov(z1_abs2)
-                    dist_m1_abs2 = cosmo.get_dist_m(z1_abs2)
-
-                    w = z1_abs2 < delta1.z_qso
-                    r_comov1 = r_comov1[w]
-                    dist_m1 = dist_m1[w]
-                    weights1 = weights1[w]
-                    z1_abs2 = z1_abs2[w]
-                    r_comov1_abs2 = r_comov1_abs2[w]
-                    dist_m1_abs2 = dist_m1_abs2[w]
-
-                    r_comov2 = delta2.r_comov
-                    dist_m2 = delta2.dist_m
-                    weights2 = delta2.weights
-                    z2_abs1 = (10**delta2.log_lambda /
-                               constants.ABSORBER_IGM[abs_igm1] - 1)
-                    r_comov2_abs1 = cosmo.get_r_comov(z2_abs1)
-                    dist_m2_abs1 = cosmo.get_dist_m(z2_abs1)
-
-                    w = z2_abs1 < delta2.z_qso
-                    r_comov2 = r_comov2[w]
-                    dist_m2 = dist_m2[w]
-                    weights2 = weights2[w]
-                    z2_abs1 = z2_abs1[w]
-                    r_comov2_abs1 = r_comov2_abs1[w]
-                    dist_m2_abs1 = dist_m2_abs1[w]
-
-                    r_par = (r_comov1[:, None] - r_comov2) * np.cos(ang / 2)
-                    if not x_correlation:
-                        r_par = abs(r_par)
-
-                    r_trans = (dist_m1[:, None] + dist_m2) * np.sin(ang / 2)
-                    weights12 = weights1[:, None] * weights2
-
-                    bins_r_par = np.floor(
-                        (r_par - r_par_min) / (r_par_max - r_par_min) *
-                        num_bins_r_par).astype(int)
-                    bins_r_trans = (r_trans / r_trans_max *
-                                    num_bins_r_trans).astype(int)
-                    if remove_same_half_plate_close_pairs and same_half_plate:
-                        weights12[abs(r_par) < (r_par_max - r_par_min) /
-                                  num_bins_r_par] = 0.
-                    bins = bins_r_trans + num_bins_r_trans * bins_r_par
-                    w = ((bins_r_par < num_bins_r_par) &
-                         (bins_r_trans < num_bins_r_trans) & (bins_r_par >= 0))
-                    rebin = np.bincount(bins[w], weights=weights12[w])
-                    weights_dmat[:len(rebin)] += rebin
-                    r_par_abs2_abs1 = (r_comov1_abs2[:, None] -
-                                       r_comov2_abs1) * np.cos(ang / 2)
-                    if not x_correlation:
-                        r_par_abs2_abs1 = abs(r_par_abs2_abs1)
-
-                    r_trans_abs2_abs1 = (dist_m1_abs2[:, None] +
-                                         dist_m2_abs1) * np.sin(ang / 2)
-                    z_weight_evol = (
-                        (1 + z1_abs2[:, None])**(alpha_abs[abs_igm2] - 1) *
-                        (1 + z2_abs1)**(alpha_abs[abs_igm1] - 1) / (1 + z_ref)
-                        **(alpha_abs[abs_igm1] + alpha_abs[abs_igm2] - 2))
-
-                    model_bins_r_par = np.floor(
-                        (r_par_abs2_abs1 - r_par_min) /
-                        (r_par_max - r_par_min) *
-                        num_model_bins_r_par).astype(int)
-                    model_bins_r_trans = (r_trans_abs2_abs1 / r_trans_max *
-                                          num_model_bins_r_trans).astype(int)
-                    model_bins = (model_bins_r_trans +
-                                  num_model_bins_r_trans * model_bins_r_par)
-                    w &= ((model_bins_r_par < num_model_bins_r_par) &
-                          (model_bins_r_trans < num_model_bins_r_trans) &
-                          (model_bins_r_par >= 0))
-
-                    rebin = np.bincount(
-                        model_bins[w],
-                        weights=(r_par_abs2_abs1[w] * weights12[w] *
-                                 z_weight_evol[w]))
-                    r_par_eff[:len(rebin)] += rebin
-                    rebin = np.bincount(
-                        model_bins[w],
-                        weights=(r_trans_abs2_abs1[w] * weights12[w] *
-                                 z_weight_evol[w]))
-                    r_trans_eff[:len(rebin)] += rebin
-                    rebin = np.bincount(
-                        model_bins[w],
-                        weights=((z1_abs2[:, None] + z2_abs1)[w] / 2 *
-                                 weights12[w] * z_weight_evol[w]))
-                    z_eff[:len(rebin)] += rebin
-                    rebin = np.bincount(model_bins[w],
-                                        weights=weights12[w] * z_weight_evol[w])
-                    weight_eff[:len(rebin)] += rebin
-
-                    rebin = np.bincount((model_bins[w] + num_model_bins_r_par *
-                                         num_model_bins_r_trans * bins[w]),
-                                        weights=weights12[w] * z_weight_evol[w])
-                    dmat[:len(rebin)] += rebin
-            setattr(delta1, "neighbours", None)
+    Returns:
+        The following variables:
+            r_comov: Comoving distance of the pixels
+            dist_m: Angular diameter distance of the pixels
+            weights: Weights of the pixels
+            r_comov_abs: Comoving distance of the pixels assuming the metal
+                absorption
+            dist_m_abs: Angular diameter distance of the pixels assuming the
+                metal absorption
+            z_abs: Redshift of the pixels assuming the metal absorption
+    """
+    z_abs = 10**delta.log_lambda / constants.ABSORBER_IGM[abs_igm] - 1
+    w = z_abs < delta.z_qso
+    z_abs = z_abs[w]
+    return (delta.r_comov[w], delta.dist_m[w], delta.weights[w],
+            cosmo.get_r_comov(z_abs), cosmo.get_dist_m(z_abs), z_abs)
 
-    dmat = dmat.reshape(num_bins_r_par * num_bins_r_trans,
-                        num_model_bins_r_par * num_model_bins_r_trans)
-    return (weights_dmat, dmat, r_par_eff, r_trans_eff, z_eff, weight_eff,
-            num_pairs, num_pairs_used)
+
+@jit(nopython=True)
+def compute_metal_dmat_forest_pairs(r_comov1, dist_m1, weights1, r_comov1_abs1,
+                                    dist_m1_abs1, z1_abs1, r_comov2, dist_m2,
+                                    weights2, r_comov2_abs2, dist_m2_abs2,
+                                    z2_abs2, alpha_abs1, alpha_abs2, ang,
+                                    same_half_plate, weights_dmat, dmat,
+                                    r_par_eff, r_trans_eff, z_eff, weight_eff):
+    """Computes the contribution of a given pair of forests to the metal
+    distortion matrix.
+
+    Args:
+        r_comov1: array of floats
+            Comoving distance (in Mpc/h) for forest 1
+        dist_m1: array of floats
+            Angular diameter distance for forest 1
+        weights1: array of floats
+            Weights for forest 1
+        r_comov1_abs1: array of floats
+            Comoving distance (in Mpc/h) for forest 1 assuming absorption 1
+        dist_m1_abs1: array of floats
+            Angular diameter distance for forest 1 assuming absorption 1
+        z1_abs1: array of floats
+            Redshifts for forest 1 assuming absorption 1
+        r_comov2: array of floats
+            Comoving distance (in Mpc/h) for forest 2
+        dist_m2: array of floats
+            Angular diameter distance for forest 2
+        weights2: array of floats
+            Weights for forest 2
+        r_comov2_abs2: array of floats
+            Comoving distance (in Mpc/h) for forest 2 assuming absorption 2
+        dist_m2_abs2: array of floats
+            Angular diameter distance for forest 2 assuming absorption 2
+        z2_abs2: array of floats
+            Redshifts for forest 2 assuming absorption 2
+        alpha_abs1: float
+            Redshift evolution coefficient of absorption 1
+        alpha_abs2: float
+            Redshift evolution coefficient of absorption 2
+        ang: float
+            Angular separation between the two forests
+        same_half_plate: bool
+            Flag to determine if the two forests are on the same half plate
+        weights_dmat: array of floats
+            Total weight in the distortion matrix pixels
+        dmat: array of floats
+            The distortion matrix
+        r_par_eff: array of floats
+            Effective parallel distance of the distortion matrix pixels
+        r_trans_eff: array of floats
+            Effective transverse distance of the distortion matrix pixels
+        z_eff: array of floats
+            Effective redshift of the distortion matrix pixels
+        weight_eff: array of floats
+            Effective weight of the distortion matrix pixels
+    """
+    cos_half_ang = np.cos(ang / 2)
+    sin_half_ang = np.sin(ang / 2)
+    z_weight_evol1 = (1 + z1_abs1)**(alpha_abs1 - 1)
+    z_weight_evol2 = (1 + z2_abs2)**(alpha_abs2 - 1)
+    z_weight_evol_ref = (1 + z_ref)**(alpha_abs1 + alpha_abs2 - 2)
+
+    for i in range(r_comov1.size):
+        for j in range(r_comov2.size):
+            # bins in the distortion matrix
+            r_par = (r_comov1[i] - r_comov2[j]) * cos_half_ang
+            if not x_correlation:
+                r_par = np.abs(r_par)
+            r_trans = (dist_m1[i] + dist_m2[j]) * sin_half_ang
+            bins_r_par = int(
+                np.floor((r_par - r_par_min) / (r_par_max - r_par_min) *
+                         num_bins_r_par))
+            bins_r_trans = int(r_trans / r_trans_max * num_bins_r_trans)
+            if (bins_r_par < 0 or bins_r_par >= num_bins_r_par or
+                    bins_r_trans >= num_bins_r_trans):
+                continue
+
+            weights12 = weights1[i] * weights2[j]
+            if (remove_same_half_plate_close_pairs and same_half_plate and
+                    np.abs(r_par) < (r_par_max - r_par_min) / num_bins_r_par):
+                weights12 = 0.
+            bins = bins_r_trans + num_bins_r_trans * bins_r_par
+            weights_dmat[bins] += weights12
+
+            # bins in the model, computed assuming the metal absorptions
+            r_par_abs1_abs2 = ((r_comov1_abs1[i] - r_comov2_abs2[j]) *
+                               cos_half_ang)
+            if not x_correlation:
+                r_par_abs1_abs2 = np.abs(r_par_abs1_abs2)
+            r_trans_abs1_abs2 = ((dist_m1_abs1[i] + dist_m2_abs2[j]) *
+                                 sin_half_ang)
+            model_bins_r_par = int(
+                np.floor((r_par_abs1_abs2 - r_par_min) /
+                         (r_par_max - r_par_min) * num_model_bins_r_par))
+            model_bins_r_trans = int(r_trans_abs1_abs2 / r_trans_max *
+                                     num_model_bins_r_trans)
+            if (model_bins_r_par < 0 or
+                    model_bins_r_par >= num_model_bins_r_par or
+                    model_bins_r_trans >= num_model_bins_r_trans):
+                continue
+            model_bins = (model_bins_r_trans +
+                          num_model_bins_r_trans * model_bins_r_par)
+
+            weights12_evol = weights12 * (z_weight_evol1[i] *
+                                          z_weight_evol2[j] / z_weight_evol_ref)
+            dmat[model_bins + num_model_bins_r_par * num_model_bins_r_trans *
+                 bins] += weights12_evol
+            r_par_eff[model_bins] += r_par_abs1_abs2 * weights12_evol
+            r_trans_eff[model_bins] += r_trans_abs1_abs2 * weights12_evol
+            z_eff[model_bins] += (z1_abs1[i] + z2_abs2[j]) / 2 * weights12_evol
+            weight_eff[model_bins] += weights12_evol
 
 
 def compute_xi_1d(healpix):
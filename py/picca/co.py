@@ -7,10 +7,12 @@ This module provides several functions:
     - compute_xi_forest_pairs
 See the respective docstrings for more details
 """
+from itertools import compress
 import numpy as np
 from healpy import query_disc
 from numba import jit
 
+from picca.data import QSO
 from picca.utils import userprint
 
 num_bins_r_par = None
@@ -40,30 +42,45 @@ def fill_neighs(healpixs):
         healpixs: array of ints
             List of healpix numbers
     """
+    if objs2 is not None:
+        other_objs = objs2
+    else:
+        other_objs = objs
+    # coordinates of the objects in each healpix, gathered once per healpix
+    # and shared by all the objects querying it
+    healpix_coords = {}
+    healpix_thingids = {}
     for healpix in healpixs:
         for obj1 in objs[healpix]:
             healpix_neighbours = query_disc(
                 nside, [obj1.x_cart, obj1.y_cart, obj1.z_cart],
                 ang_max,
                 inclusive=True)
-            if objs2 is not None:
-                healpix_neighbours = [
-                    healpix for healpix in healpix_neighbours
-                    if healpix in objs2
-                ]
-                neighbours = [
-                    obj2 for healpix in healpix_neighbours
-                    for obj2 in objs2[healpix] if obj1.thingid != obj2.thingid
-                ]
-            else:
-                healpix_neighbours = [
-                    healpix for healpix in healpix_neighbours if healpix in objs
-                ]
-                neighbours = [
-                    obj2 for healpix in healpix_neighbours
-                    for obj2 in objs[healpix] if obj1.thingid != obj2.thingid
-                ]
-            ang = obj1.get_angle_between(neighbours)
+            healpix_neighbours = [
+                other_healpix for other_healpix in healpix_neighbours
+                if other_healpix in other_objs
+            ]
+            if len(healpix_neighbours) == 0:
+                obj1.neighbours = np.array([])
+                continue
+            for other_healpix in healpix_neighbours:
+                if other_healpix not in healpix_coords:
+                    healpix_coords[other_healpix] = QSO.get_coordinates(
+                        other_objs[other_healpix])
+                    healpix_thingids[other_healpix] = np.array(
+                        [obj2.thingid for obj2 in other_objs[other_healpix]])
+            w = np.concatenate([
+                healpix_thingids[other_healpix]
+                for other_healpix in healpix_neighbours
+            ]) != obj1.thingid
+            neighbours = list(
+                compress((obj2 for other_healpix in healpix_neighbours
+                          for obj2 in other_objs[other_healpix]), w))
+            ang = obj1.get_angle_between(
+                np.concatenate([
+                    healpix_coords[other_healpix]
+                    for other_healpix in healpix_neighbours
+                ])[w])
             w = ang < ang_max
             neighbours = np.array(neighbours)[w]
             obj1.neighbours = np.array([
@@ -1,17 +1,108 @@
 """This module defines data structure to deal with line of sight data.
 
 This module provides with three classes (QSO, Forest, Delta)
-to manage the line-of-sight data. 
+to manage the line-of-sight data, and the functions rebin_ivar_weighted
+and get_cont_chi2 used to rebin them and to fit their continuum.
 See the respective docstrings for more details
 """
 import numpy as np
+from numba import jit
 import iminuit
 import fitsio
 
 from picca import constants
-from picca.utils import userprint, unred
+from picca.utils import userprint, unred, to_native_float
 from picca.dla import DLA
 
+@jit(nopython=True)
+def rebin_ivar_weighted(bins, weights, num_bins):
+    """Accumulates inverse variance weighted quantities in the wavelength bins.
+
+    Each bin index is read once and fans out to all the accumulators.
+
+    Args:
+        bins: array of ints
+            Index of the bin of the wavelength grid each pixel falls in
+        weights: array of floats
+            Quantities to be accumulated, with one row per quantity. The first
+            row is typically the inverse variance and the others the inverse
+            variance weighted quantities
+        num_bins: int
+            Number of bins of the wavelength grid
+
+    Returns:
+        An array of shape (weights.shape[0], num_bins) with the sum of each
+        quantity in each bin.
+    """
+    rebinned = np.zeros((weights.shape[0], num_bins))
+    for index in range(bins.size):
+        bin_index = bins[index]
+        for quantity in range(weights.shape[0]):
+            rebinned[quantity, bin_index] += weights[quantity, index]
+    return rebinned
+
+
+@jit(nopython=True, error_model='numpy')
+def get_cont_chi2(p0, p1, flux, log_lambda_offset, log_lambda_range, mean_cont,
+                  ivar, eta, var_lss, fudge, use_constant_weights):
+    """Computes the chi2 of the continuum model used in Forest.cont_fit.
+
+    The model is the mean continuum multiplied by a linear function of the
+    wavelength. The sum is accumulated in a single pass over the pixels.
+    Divisions follow numpy semantics, so that a null continuum gives a nan
+    chi2 (flagged by cont_fit) instead of raising ZeroDivisionError.
+
+    Args:
+        p0: float
+            Zero point of the linear function (flux mean)
+        p1: float
+            Slope of the linear function (evolution of the flux)
+        flux: array of floats
+            Flux
+        log_lambda_offset: array of floats
+            Logarithm of the wavelength minus log_lambda_min
+        log_lambda_range: float
+            Difference between log_lambda_max and log_lambda_min
+        mean_cont: array of floats
+            Mean continuum
+        ivar: array of floats
+            Pipeline inverse variance of the flux
+        eta: array of floats
+            Correction factor to the contribution of the pipeline estimate of
+            the instrumental noise to the variance.
+        var_lss: array of floats
+            Pixel variance due to the Large Scale Strucure
+        fudge: array of floats
+            Fudge contribution to the variance
+        use_constant_weights: bool
+            If True, all the pixels are given a weight of 1
+
+    Returns:
+        The obtained chi2
+    """
+    chi2 = 0.
+    for index in range(flux.size):
+        cont_model = p1 * log_lambda_offset[index] / log_lambda_range + p0
+        cont_model *= mean_cont[index]
+        residual = flux[index] - cont_model
+        residual *= residual
+        if use_constant_weights:
+            chi2 += residual
+            continue
+        cont_model *= cont_model
+        # compute the inverse of the pipeline variance of delta directly,
+        # so that a single division gives the pipeline variance
+        ivar_pipe = ivar[index] * cont_model
+        var_pipe = 1. / ivar_pipe
+        ## prep_del.variance is the variance of delta
+        ## we want here the weights = ivar(flux)
+        variance = (eta[index] * var_pipe + var_lss[index] +
+                    fudge[index] * ivar_pipe)
+        weight = 1.0 / (cont_model * variance)
+        chi2 += residual * weight - np.log(weight)
+    return chi2
+
+
 class QSO(object):
     """Class to represent quasar objects.
 
@@ -56,6 +147,8 @@ class QSO(object):
     Methods:
         __init__: Initialize class instance.
         get_angle_between: Computes the angular separation between two quasars.
+        get_coordinates: Gathers the angular coordinates of a list of objects
+            in a single array.
     """
 
     def __init__(self, thingid, ra, dec, z_qso, plate, mjd, fiberid):
@@ -85,10 +178,10 @@ class QSO(object):
         self.fiberid = fiberid
 
         ## cartesian coordinates
-        self.x_cart = np.cos(ra) * np.cos(dec)
-        self.y_cart = np.sin(ra) * np.cos(dec)
-        self.z_cart = np.sin(dec)
         self.cos_dec = np.cos(dec)
+        self.x_cart = np.cos(ra) * self.cos_dec
+        self.y_cart = np.sin(ra) * self.cos_dec
+        self.z_cart = np.sin(dec)
 
         self.z_qso = z_qso
         self.thingid = thingid
@@ -101,44 +194,38 @@ class QSO(object):
         # variables computed in modules bin.picca_xcf_angl and bin.picca_xcf1d
         self.log_lambda = None
 
+    @staticmethod
+    def get_coordinates(data):
+        """Gathers the angular coordinates of a list of objects in a single
+        array.
+
+        Args:
+            data: list of QSO
+                Objects whose coordinates are gathered
+
+        Returns:
+            An array of shape (len(data), 5) with the columns x_cart, y_cart,
+            z_cart, ra and dec.
+        """
+        return np.array([(d.x_cart, d.y_cart, d.z_cart, d.ra, d.dec)
+                         for d in data],
+                        dtype=float).reshape(-1, 5)
+
     def get_angle_between(self, data):
         """Computes the angular separation between two quasars.
 
         Args:
-            data: QSO or list of QSO
+            data: QSO, list of QSO or array of floats
                 Objects with which the angular separation will
-                be computed.
+                be computed. An array of floats is interpreted as the
+                output of get_coordinates.
 
         Returns
             A float or an array (depending on input data) with the angular
             separation between this quasar and the object(s) in data.
         """
-        # case 1: data is list-like
-        try:
-            x_cart = np.array([d.x_cart for d in data])
-            y_cart = np.array([d.y_cart for d in data])
-            z_cart = np.array([d.z_cart for d in data])
-            ra = np.array([d.ra for d in data])
-            dec = np.array([d.dec for d in data])
-
-            cos = x_cart * self.x_cart + y_cart * self.y_cart + z_cart * self.z_cart
-            w = cos >= 1.
-            if w.sum() != 0:
-                userprint('WARNING: {} pairs have cos>=1.'.format(w.sum()))
-                cos[w] = 1.
-            w = cos <= -1.
-            if w.sum() != 0:
-                userprint('WARNING: {} pairs have cos<=-1.'.format(w.sum()))
-                cos[w] = -1.
-            angl = np.arccos(cos)
-
-            w = ((np.absolute(ra - self.ra) < constants.SMALL_ANGLE_CUT_OFF) &
-                 (np.absolute(dec - self.dec) < constants.SMALL_ANGLE_CUT_OFF))
-            if w.sum() != 0:
-                angl[w] = np.sqrt((dec[w] - self.dec)**2 +
-                                  (self.cos_dec * (ra[w] - self.ra))**2)
-        # case 2: data is a QSO
-        except TypeError:
+        # case 1: data is a QSO
+        if isinstance(data, QSO):
             x_cart = data.x_cart
             y_cart = data.y_cart
             z_cart = data.z_cart
@@ -157,6 +244,30 @@ class QSO(object):
                     (np.absolute(dec - self.dec) < constants.SMALL_ANGLE_CUT_OFF)):
                 angl = np.sqrt((dec - self.dec)**2 + (self.cos_dec *
                                                       (ra - self.ra))**2)
+            return angl
+
+        # case 2: data is list-like
+        if isinstance(data, np.ndarray) and data.dtype.kind == "f":
+            coords = data
+        else:
+            coords = QSO.get_coordinates(data)
+        x_cart, y_cart, z_cart, ra, dec = coords.T
+
+        cos = x_cart * self.x_cart + y_cart * self.y_cart + z_cart * self.z_cart
+        num_above = np.count_nonzero(cos >= 1.)
+        if num_above != 0:
+            userprint('WARNING: {} pairs have cos>=1.'.format(num_above))
+        num_below = np.count_nonzero(cos <= -1.)
+        if num_below != 0:
+            userprint('WARNING: {} pairs have cos<=-1.'.format(num_below))
+        np.clip(cos, -1., 1., out=cos)
+        angl = np.arccos(cos)
+
+        w = ((np.absolute(ra - self.ra) < constants.SMALL_ANGLE_CUT_OFF) &
+             (np.absolute(dec - self.dec) < constants.SMALL_ANGLE_CUT_OFF))
+        if w.sum() != 0:
+            angl[w] = np.sqrt((dec[w] - self.dec)**2 +
+                              (self.cos_dec * (ra[w] - self.ra))**2)
         return angl
 
 
@@ -236,11 +347,14 @@ class Forest(QSO):
 
     Methods:
         __init__: Initializes class instances.
-        __add__: Adds the information of another forest.
+        coadd: Coadds the information of another forest.
+        rebin_quantities: Rebins quantities onto the wavelength grid using
+            inverse variance weighting.
         correct_flux: Corrects for multiplicative errors in pipeline flux
             calibration.
         correct_ivar: Corrects for multiplicative errors in pipeline inverse
             variance calibration.
+        get_num_bins: Computes the number of bins of the wavelength grid.
         get_var_lss: Interpolates the pixel variance due to the Large Scale
             Strucure on the wavelength array.
         get_eta: Interpolates the correction factor to the contribution of the
@@ -250,6 +364,9 @@ class Forest(QSO):
             wavelength array.
         get_mean_cont: Interpolates the mean quasar continuum over the whole
             sample on the wavelength array.
+        apply_mask: Removes the masked pixels from all the pixel arrays.
+        get_outside_ranges: Flags the pixels lying outside all the given
+            wavelength ranges.
         mask: Applies wavelength masking.
         add_optical_depth: Adds the contribution of a given species to the mean
             optical depth.
@@ -451,17 +568,34 @@ class Forest(QSO):
             if not exposures_diff is None:
                 exposures_diff /= corr
 
+        ## drop pixels without inverse variance first so that the range cut
+        ## and the rebinning run on the remaining pixels only
+        w = ivar > 0.
+        if not w.any():
+            return
+        if not w.all():
+            log_lambda = log_lambda[w]
+            flux = flux[w]
+            ivar = ivar[w]
+            if mean_expected_flux_frac is not None:
+                mean_expected_flux_frac = mean_expected_flux_frac[w]
+            if exposures_diff is not None:
+                exposures_diff = exposures_diff[w]
+            if reso is not None:
+                reso = reso[w]
+
         ## cut to specified range
-        bins = (np.floor((log_lambda - Forest.log_lambda_min) /
-                         Forest.delta_log_lambda + 0.5).astype(int))
+        # truncation only matches the rounding to the nearest bin for
+        # non-negative values, which are the only ones kept
+        bins = ((log_lambda - Forest.log_lambda_min) / Forest.delta_log_lambda +
+                0.5)
+        w = (bins >= 0.)
+        bins = bins.astype(int)
         log_lambda = Forest.log_lambda_min + bins * Forest.delta_log_lambda
-        w = (log_lambda >= Forest.log_lambda_min)
-        w = w & (log_lambda < Forest.log_lambda_max)
-        w = w & (log_lambda - np.log10(1. + self.z_qso) >
-                 Forest.log_lambda_min_rest_frame)
-        w = w & (log_lambda - np.log10(1. + self.z_qso) <
-                 Forest.log_lambda_max_rest_frame)
-        w = w & (ivar > 0.)
+        w &= (log_lambda < Forest.log_lambda_max)
+        rest_frame_log_lambda = log_lambda - np.log10(1. + self.z_qso)
+        w &= (rest_frame_log_lambda > Forest.log_lambda_min_rest_frame)
+        w &= (rest_frame_log_lambda < Forest.log_lambda_max_rest_frame)
         if w.sum() == 0:
             return
         bins = bins[w]
@@ -476,41 +610,30 @@ class Forest(QSO):
             reso = reso[w]
 
         # rebin arrays
-        rebin_log_lambda = (Forest.log_lambda_min +
-                            np.arange(bins.max() + 1) * Forest.delta_log_lambda)
-        rebin_flux = np.zeros(bins.max() + 1)
-        rebin_ivar = np.zeros(bins.max() + 1)
-        if mean_expected_flux_frac is not None:
-            rebin_mean_expected_flux_frac = np.zeros(bins.max() + 1)
-        rebin_flux_aux = np.bincount(bins, weights=ivar * flux)
-        rebin_ivar_aux = np.bincount(bins, weights=ivar)
+        rebin_log_lambda = (Forest.log_lambda_min + np.arange(
+            Forest.get_num_bins()) * Forest.delta_log_lambda)
+        # this should contain all quantities that are to be rebinned using
+        # ivar weighting
+        ivar_rebin_data = {'flux': flux}
         if mean_expected_flux_frac is not None:
-            rebin_mean_expected_flux_frac_aux = np.bincount(
-                bins, weights=ivar * mean_expected_flux_frac)
+            ivar_rebin_data['mean_expected_flux_frac'] = mean_expected_flux_frac
         if exposures_diff is not None:
-            rebin_exposures_diff = np.bincount(bins,
-                                               weights=ivar * exposures_diff)
+            ivar_rebin_data['exposures_diff'] = exposures_diff
         if reso is not None:
-            rebin_reso = np.bincount(bins, weights=ivar * reso)
-        rebin_flux[:len(rebin_flux_aux)] += rebin_flux_aux
-        rebin_ivar[:len(rebin_ivar_aux)] += rebin_ivar_aux
-        if mean_expected_flux_frac is not None:
-            rebin_mean_expected_flux_frac[:len(
-                rebin_mean_expected_flux_frac_aux
-            )] += rebin_mean_expected_flux_frac_aux
+            ivar_rebin_data['reso'] = reso
+        rebin_ivar, rebin_values = Forest.rebin_quantities(
+            bins, ivar, ivar_rebin_data.values())
         w = (rebin_ivar > 0.)
         if w.sum() == 0:
             return
         log_lambda = rebin_log_lambda[w]
-        flux = rebin_flux[w] / rebin_ivar[w]
         ivar = rebin_ivar[w]
-        if mean_expected_flux_frac is not None:
-            mean_expected_flux_frac = (rebin_mean_expected_flux_frac[w] /
-                                       rebin_ivar[w])
-        if exposures_diff is not None:
-            exposures_diff = rebin_exposures_diff[w] / rebin_ivar[w]
-        if reso is not None:
-            reso = rebin_reso[w] / rebin_ivar[w]
+        for key, rebin_value in zip(ivar_rebin_data, rebin_values):
+            ivar_rebin_data[key] = rebin_value[w] / ivar
+        flux = ivar_rebin_data['flux']
+        mean_expected_flux_frac = ivar_rebin_data.get('mean_expected_flux_frac')
+        exposures_diff = ivar_rebin_data.get('exposures_diff')
+        reso = ivar_rebin_data.get('reso')
 
         # Flux calibration correction
         try:
@@ -543,13 +666,10 @@ class Forest(QSO):
         else:
             self.mean_reso = None
 
-        error = 1.0 / np.sqrt(ivar)
-        snr = flux / error
-        self.mean_snr = sum(snr) / float(len(snr))
+        self.mean_snr = np.mean(flux * np.sqrt(ivar))
         lambda_abs_igm = constants.ABSORBER_IGM[self.abs_igm]
-        self.mean_z = ((np.power(10., log_lambda[len(log_lambda) - 1]) +
-                        np.power(10., log_lambda[0])) / 2. / lambda_abs_igm -
-                       1.0)
+        self.mean_z = ((10.**log_lambda[-1] + 10.**log_lambda[0]) / 2. /
+                       lambda_abs_igm - 1.0)
 
         # continuum-related variables
         self.cont = None
@@ -558,74 +678,171 @@ class Forest(QSO):
         self.bad_cont = None
         self.order = None
 
+    @classmethod
+    def get_num_bins(cls):
+        """Computes the number of bins of the wavelength grid.
+
+        The grid starts at log_lambda_min and has a spacing of
+        delta_log_lambda. It covers all the pixels below log_lambda_max.
+
+        Returns:
+            The number of bins
+        """
+        return int(
+            round((cls.log_lambda_max - cls.log_lambda_min) /
+                  cls.delta_log_lambda)) + 1
+
+    @staticmethod
+    def rebin_quantities(bins, ivar, values):
+        """Rebins quantities onto the wavelength grid using inverse variance
+        weighting.
+
+        All the quantities are accumulated in a single pass over the pixels
+        (see function rebin_ivar_weighted).
+
+        Args:
+            bins: array of ints
+                Index of the bin of the wavelength grid each pixel falls in.
+                Must be non-negative and smaller than the value returned by
+                get_num_bins
+            ivar: array of floats
+                Inverse variance associated to each pixel
+            values: iterable of arrays of floats
+                Quantities to be rebinned (one value per pixel each)
+
+        Returns:
+            rebin_ivar: array of floats
+                Sum of the inverse variances in each bin
+            rebin_values: array of floats
+                Sum of the inverse variance weighted quantities in each bin,
+                with one row per quantity. Divide by rebin_ivar to obtain the
+                weighted mean.
+
+        Raises:
+            ValueError: if a bin falls outside the wavelength grid
+        """
+        num_bins = Forest.get_num_bins()
+        # the compiled kernel does not check bounds
+        if bins.size > 0 and (bins.min() < 0 or bins.max() >= num_bins):
+            raise ValueError(("Bins should be between 0 and {}, found bins "
+                              "between {} and {}").format(
+                                  num_bins - 1, bins.min(), bins.max()))
+        rebinned = rebin_ivar_weighted(
+            bins, np.vstack([ivar] + [ivar * value for value in values]),
+            num_bins)
+        return rebinned[0], rebinned[1:]
+
     def coadd(self, other):
-        """Coadds the information of another forest.
+        """Coadds the information of another forest (or forests).
 
-        Forests are coadded by using inverse variance weighting.
+        Forests are coadded by using inverse variance weighting. When a list
+        of forests is given, all of them are rebinned together in a single
+        pass.
 
         Args:
-            other: Forest
-                The forest instance to be coadded. If other does not have the
-                attribute log_lambda, then the method returns without doing
-                anything.
+            other: Forest or list of Forest
+                The forest instance(s) to be coadded. If this forest does not
+                have the attribute log_lambda, then the method returns without
+                doing anything. Forests in other without the attribute
+                log_lambda are ignored.
 
         Returns:
             The coadded forest.
         """
-        if self.log_lambda is None or other.log_lambda is None:
+        if isinstance(other, Forest):
+            other = [other]
+        forests = [self] + [
+            forest for forest in other if forest.log_lambda is not None
+        ]
+        if self.log_lambda is None or len(forests) == 1:
             return self
 
+        def concatenate(param):
+            """Concatenates the values of a pixel array of all the forests"""
+            return np.concatenate(
+                [getattr(forest, param) for forest in forests])
+
         # this should contain all quantities that are to be coadded using
         # ivar weighting
         ivar_coadd_data = {}
 
-        log_lambda = np.append(self.log_lambda, other.log_lambda)
-        ivar_coadd_data['flux'] = np.append(self.flux, other.flux)
-        ivar = np.append(self.ivar, other.ivar)
+        log_lambda = concatenate('log_lambda')
+        ivar_coadd_data['flux'] = concatenate('flux')
+        ivar = concatenate('ivar')
 
-        if self.mean_expected_flux_frac is not None:
-            mean_expected_flux_frac = np.append(self.mean_expected_flux_frac,
-                                                other.mean_expected_flux_frac)
-            ivar_coadd_data['mean_expected_flux_frac'] = mean_expected_flux_frac
-
-        if self.exposures_diff is not None:
-            ivar_coadd_data['exposures_diff'] = np.append(
-                self.exposures_diff, other.exposures_diff)
-        if self.reso is not None:
-            ivar_coadd_data['reso'] = np.append(self.reso, other.reso)
+        for param in ['mean_expected_flux_frac', 'exposures_diff', 'reso']:
+            if getattr(self, param) is not None:
+                ivar_coadd_data[param] = concatenate(param)
 
         # coadd the deltas by rebinning
-        bins = np.floor((log_lambda - Forest.log_lambda_min) /
-                        Forest.delta_log_lambda + 0.5).astype(int)
-        rebin_log_lambda = Forest.log_lambda_min + (np.arange(bins.max() + 1) *
-                                                    Forest.delta_log_lambda)
-        rebin_ivar = np.zeros(bins.max() + 1)
-        rebin_ivar_aux = np.bincount(bins, weights=ivar)
-        rebin_ivar[:len(rebin_ivar_aux)] += rebin_ivar_aux
+        # all the pixels are already on the wavelength grid, so truncation
+        # gives the nearest bin
+        bins = ((log_lambda - Forest.log_lambda_min) / Forest.delta_log_lambda +
+                0.5).astype(int)
+        rebin_log_lambda = (Forest.log_lambda_min + np.arange(
+            Forest.get_num_bins()) * Forest.delta_log_lambda)
+        rebin_ivar, rebin_values = Forest.rebin_quantities(
+            bins, ivar, ivar_coadd_data.values())
         w = (rebin_ivar > 0.)
         self.log_lambda = rebin_log_lambda[w]
         self.ivar = rebin_ivar[w]
 
         # rebin using inverse variance weighting
-        for key, value in ivar_coadd_data.items():
-            rebin_value = np.zeros(bins.max() + 1)
-            rebin_value_aux = np.bincount(bins, weights=ivar * value)
-            rebin_value[:len(rebin_value_aux)] += rebin_value_aux
+        for key, rebin_value in zip(ivar_coadd_data, rebin_values):
             setattr(self, key, rebin_value[w] / rebin_ivar[w])
 
         # recompute means of quality variables
         if self.reso is not None:
             self.mean_reso = self.reso.mean()
-        error = 1. / np.sqrt(self.ivar)
-        snr = self.flux / error
-        self.mean_snr = snr.mean()
+        self.mean_snr = np.mean(self.flux * np.sqrt(self.ivar))
         lambda_abs_igm = constants.ABSORBER_IGM[self.abs_igm]
-        self.mean_z = ((np.power(10., log_lambda[len(log_lambda) - 1]) +
-                        np.power(10., log_lambda[0])) / 2. / lambda_abs_igm -
-                       1.0)
+        self.mean_z = ((10.**log_lambda[-1] + 10.**log_lambda[0]) / 2. /
+                       lambda_abs_igm - 1.0)
 
         return self
 
+    def apply_mask(self, w):
+        """Removes the masked pixels from all the pixel arrays.
+
+        Quantities that are not set (None) are left untouched.
+
+        Args:
+            w: array of bool
+                Mask with the pixels to keep
+        """
+        for param in [
+                'ivar', 'log_lambda', 'flux', 'dla_transmission',
+                'mean_optical_depth', 'mean_expected_flux_frac',
+                'exposures_diff', 'reso'
+        ]:
+            value = getattr(self, param, None)
+            if value is not None:
+                setattr(self, param, value[w])
+
+    @staticmethod
+    def get_outside_ranges(log_lambda, mask_ranges):
+        """Flags the pixels lying outside all the given wavelength ranges.
+
+        All ranges are compared at once by broadcasting the pixels against
+        the range limits.
+
+        Args:
+            log_lambda: array of floats
+                Logarithm of the wavelength (in Angs) of the pixels
+            mask_ranges: astropy table
+                Table with columns log_wave_min and log_wave_max
+
+        Returns:
+            A boolean array, True for the pixels to keep
+        """
+        if len(mask_ranges) == 0:
+            return np.ones(log_lambda.size, dtype=bool)
+        log_wave_min = np.asarray(mask_ranges['log_wave_min'])
+        log_wave_max = np.asarray(mask_ranges['log_wave_max'])
+        inside = ((log_lambda[:, None] >= log_wave_min[None, :]) &
+                  (log_lambda[:, None] <= log_wave_max[None, :]))
+        return ~inside.any(axis=1)
+
     def mask(self, mask_table):
         """Applies wavelength masking.
 
@@ -654,23 +871,13 @@ class Forest(QSO):
         if self.log_lambda is None:
             return
 
-        w = np.ones(self.log_lambda.size, dtype=bool)
-        for mask_range in mask_obs_frame:
-            w &= ((self.log_lambda < mask_range['log_wave_min']) |
-                  (self.log_lambda > mask_range['log_wave_max']))
-        for mask_range in mask_rest_frame:
+        w = Forest.get_outside_ranges(self.log_lambda, mask_obs_frame)
+        if len(mask_rest_frame) > 0:
             rest_frame_log_lambda = self.log_lambda - np.log10(1. + self.z_qso)
-            w &= ((rest_frame_log_lambda < mask_range['log_wave_min']) |
-                  (rest_frame_log_lambda > mask_range['log_wave_max']))
+            w &= Forest.get_outside_ranges(rest_frame_log_lambda,
+                                           mask_rest_frame)
 
-        parameters = [
-            'ivar', 'log_lambda', 'flux', 'dla_transmission',
-            'mean_optical_depth', 'mean_expected_flux_frac', 'exposures_diff',
-            'reso'
-        ]
-        for param in parameters:
-            if hasattr(self, param) and (getattr(self, param) is not None):
-                setattr(self, param, getattr(self, param)[w])
+        self.apply_mask(w)
 
         return
 
@@ -732,19 +939,11 @@ class Forest(QSO):
             select_dla_mask = mask_table['frame'] == 'RF_DLA'
             mask = mask_table[select_dla_mask]
             if len(mask)>0:
-                for mask_range in mask:
-                    w &= ((self.log_lambda - np.log10(1. + z_abs) < mask_range['log_wave_min']) |
-                          (self.log_lambda - np.log10(1. + z_abs) > mask_range['log_wave_max']))
-
-        # do the actual masking
-        parameters = [
-            'ivar', 'log_lambda', 'flux', 'dla_transmission',
-            'mean_optical_depth', 'mean_expected_flux_frac', 'exposures_diff',
-            'reso'
-        ]
-        for param in parameters:
-            if hasattr(self, param) and (getattr(self, param) is not None):
-                setattr(self, param, getattr(self, param)[w])
+                dla_rest_frame_log_lambda = self.log_lambda - np.log10(1. +
+                                                                       z_abs)
+                w &= Forest.get_outside_ranges(dla_rest_frame_log_lambda, mask)
+
+        self.apply_mask(w)
 
         return
 
@@ -758,18 +957,10 @@ class Forest(QSO):
         if self.log_lambda is None:
             return
 
-        w = np.ones(self.log_lambda.size, dtype=bool)
-        w &= (np.fabs(1.e4 * (self.log_lambda - np.log10(lambda_absorber))) >
-              Forest.absorber_mask_width)
+        w = (np.fabs(1.e4 * (self.log_lambda - np.log10(lambda_absorber))) >
+             Forest.absorber_mask_width)
 
-        parameters = [
-            'ivar', 'log_lambda', 'flux', 'dla_transmission',
-            'mean_optical_depth', 'mean_expected_flux_frac', 'exposures_diff',
-            'reso'
-        ]
-        for param in parameters:
-            if hasattr(self, param) and (getattr(self, param) is not None):
-                setattr(self, param, getattr(self, param)[w])
+        self.apply_mask(w)
 
         return
 
@@ -780,14 +971,13 @@ class Forest(QSO):
         (see equation 2 of du Mas des Bourboux et al. 2020)
         Flags the forest with bad_cont if the computation fails.
         """
-        log_lambda_max = (Forest.log_lambda_max_rest_frame +
-                          np.log10(1 + self.z_qso))
-        log_lambda_min = (Forest.log_lambda_min_rest_frame +
-                          np.log10(1 + self.z_qso))
+        log_one_plus_z_qso = np.log10(1 + self.z_qso)
+        log_lambda_max = Forest.log_lambda_max_rest_frame + log_one_plus_z_qso
+        log_lambda_min = Forest.log_lambda_min_rest_frame + log_one_plus_z_qso
         # get mean continuum
         try:
             mean_cont = Forest.get_mean_cont(self.log_lambda -
-                                             np.log10(1 + self.z_qso))
+                                             log_one_plus_z_qso)
         except ValueError:
             raise Exception("Problem found when loading get_mean_cont")
 
@@ -808,6 +998,14 @@ class Forest(QSO):
         # fudge contribution to the variance
         fudge = Forest.get_fudge(self.log_lambda)
 
+        # quantities that do not change between chi2 evaluations
+        log_lambda_offset = self.log_lambda - log_lambda_min
+        log_lambda_range = log_lambda_max - log_lambda_min
+        # force weights=1 when use-constant-weight
+        # TODO: make this condition clearer, maybe pass an option
+        # use_constant_weights?
+        use_constant_weights = (eta == 0).all()
+
         def get_cont_model(p0, p1):
             """Models the flux continuum by multiplying the mean_continuum
             by a linear function
@@ -819,16 +1017,16 @@ class Forest(QSO):
                     Slope of the linear function (evolution of the flux)
 
             Global args (defined only in the scope of function cont_fit)
-                log_lambda_min: float
-                    Minimum logarithm of the wavelength (in Angs)
-                log_lambda_max: float
-                    Minimum logarithm of the wavelength (in Angs)
+                log_lambda_offset: array of floats
+                    Logarithm of the wavelength minus log_lambda_min
+                log_lambda_range: float
+                    Difference between log_lambda_max and log_lambda_min
                 mean_cont: array of floats
                     Mean continuum
             """
-            line = (p1 * (self.log_lambda - log_lambda_min) /
-                    (log_lambda_max - log_lambda_min) + p0)
-            return line * mean_cont
+            line = p1 * log_lambda_offset / log_lambda_range + p0
+            line *= mean_cont
+            return line
 
         def chi2(p0, p1):
             """Computes the chi2 of a given model (see function model above).
@@ -843,25 +1041,15 @@ class Forest(QSO):
                 eta: array of floats
                     Correction factor to the contribution of the pipeline
                     estimate of the instrumental noise to the variance.
+                use_constant_weights: bool
+                    If True, all the pixels are given a weight of 1
 
             Returns:
                 The obtained chi2
             """
-            cont_model = get_cont_model(p0, p1)
-            var_pipe = 1. / self.ivar / cont_model**2
-            ## prep_del.variance is the variance of delta
-            ## we want here the weights = ivar(flux)
-
-            variance = eta * var_pipe + var_lss + fudge / var_pipe
-            weights = 1.0 / cont_model**2 / variance
-
-            # force weights=1 when use-constant-weight
-            # TODO: make this condition clearer, maybe pass an option
-            # use_constant_weights?
-            if (eta == 0).all():
-                weights = np.ones(len(weights))
-            chi2_contribution = (self.flux - cont_model)**2 * weights
-            return chi2_contribution.sum() - np.log(weights).sum()
+            return get_cont_chi2(p0, p1, self.flux, log_lambda_offset,
+                                 log_lambda_range, mean_cont, self.ivar, eta,
+                                 var_lss, fudge, use_constant_weights)
 
         p0 = (self.flux * self.ivar).sum() / self.ivar.sum()
         p1 = 0.0
@@ -882,7 +1070,10 @@ class Forest(QSO):
         self.p1 = minimizer.values["p1"]
 
         self.bad_cont = None
-        if not minimizer_result.is_valid:
+        # a nan chi2 (e.g. from a null mean continuum) is not always reported
+        # as an invalid minimum, so check the fitted continuum as well
+        if (not minimizer_result.is_valid or
+                not np.all(np.isfinite(self.cont))):
             self.bad_cont = "minuit didn't converge"
         if np.any(self.cont <= 0):
             self.bad_cont = "negative continuum"
@@ -890,7 +1081,7 @@ class Forest(QSO):
         ## if the continuum is negative, then set it to a very small number
         ## so that this forest is ignored
         if self.bad_cont is not None:
-            self.cont = self.cont * 0 + 1e-10
+            self.cont = np.full_like(self.cont, 1e-10)
             self.p0 = 0.
             self.p1 = 0.
 
@@ -1028,12 +1219,12 @@ class Delta(QSO):
         """
         header = hdu.read_header()
 
-        delta = hdu['DELTA'][:].astype(float)
-        log_lambda = hdu['LOGLAM'][:].astype(float)
+        delta = to_native_float(hdu['DELTA'][:])
+        log_lambda = to_native_float(hdu['LOGLAM'][:])
 
         if pk1d_type:
-            ivar = hdu['IVAR'][:].astype(float)
-            exposures_diff = hdu['DIFF'][:].astype(float)
+            ivar = to_native_float(hdu['IVAR'][:])
+            exposures_diff = to_native_float(hdu['DIFF'][:])
             mean_snr = header['MEANSNR']
             mean_reso = header['MEANRESO']
             mean_z = header['MEANZ']
@@ -1047,8 +1238,8 @@ class Delta(QSO):
             mean_reso = None
             delta_log_lambda = None
             mean_z = None
-            weights = hdu['WEIGHT'][:].astype(float)
-            cont = hdu['CONT'][:].astype(float)
+            weights = to_native_float(hdu['WEIGHT'][:])
+            cont = to_native_float(hdu['CONT'][:])
 
         thingid = header['THING_ID']
         ra = header['RA']
@@ -1079,26 +1270,25 @@ class Delta(QSO):
             a Delta instance
         """
 
-        cols = line.split()
+        # parse the whole line at once, the integer fields are stored
+        # exactly in the float array
+        cols = np.fromstring(line, sep=' ')
         plate = int(cols[0])
         mjd = int(cols[1])
         fiberid = int(cols[2])
-        ra = float(cols[3])
-        dec = float(cols[4])
-        z_qso = float(cols[5])
-        mean_z = float(cols[6])
-        mean_snr = float(cols[7])
-        mean_reso = float(cols[8])
-        delta_log_lambda = float(cols[9])
+        ra = cols[3]
+        dec = cols[4]
+        z_qso = cols[5]
+        mean_z = cols[6]
+        mean_snr = cols[7]
+        mean_reso = cols[8]
+        delta_log_lambda = cols[9]
 
         num_pixels = int(cols[10])
-        delta = np.array(cols[11:11 + num_pixels]).astype(float)
-        log_lambda = np.array(cols[11 + num_pixels:11 +
-                                   2 * num_pixels]).astype(float)
-        ivar = np.array(cols[11 + 2 * num_pixels:11 +
-                             3 * num_pixels]).astype(float)
-        exposures_diff = np.array(cols[11 + 3 * num_pixels:11 +
-                                       4 * num_pixels]).astype(float)
+        delta = cols[11:11 + num_pixels]
+        log_lambda = cols[11 + num_pixels:11 + 2 * num_pixels]
+        ivar = cols[11 + 2 * num_pixels:11 + 3 * num_pixels]
+        exposures_diff = cols[11 + 3 * num_pixels:11 + 4 * num_pixels]
 
         thingid = 0
         order = 0
@@ -1121,8 +1311,10 @@ class Delta(QSO):
             a list of Delta instances
         """
         hdu = fitsio.FITS(file)
-        deltas_image = hdu[0].read().astype(float)
-        ivar_image = hdu[1].read().astype(float)
+        # the images are stored with one spectrum per column, transpose them
+        # so that each spectrum is contiguous in memory
+        deltas_image = np.ascontiguousarray(hdu[0].read().T, dtype=float)
+        ivar_image = np.ascontiguousarray(hdu[1].read().T, dtype=float)
         log_lambda_image = hdu[2].read().astype(float)
         ra = hdu[3]["RA"][:].astype(np.float64) * np.pi / 180.
         dec = hdu[3]["DEC"][:].astype(np.float64) * np.pi / 180.
@@ -1132,16 +1324,17 @@ class Delta(QSO):
         fiberid = hdu[3]["FIBER"]
         thingid = hdu[3]["THING_ID"][:]
 
-        nspec = hdu[0].read().shape[1]
+        nspec = deltas_image.shape[0]
+        w_image = ivar_image > 0
         deltas = []
         for index in range(nspec):
             if index % 100 == 0:
                 userprint("\rreading deltas {} of {}".format(index, nspec),
                           end="")
 
-            delta = deltas_image[:, index]
-            ivar = ivar_image[:, index]
-            w = ivar > 0
+            delta = deltas_image[index]
+            ivar = ivar_image[index]
+            w = w_image[index]
             delta = delta[w]
             aux_ivar = ivar[w]
             log_lambda = log_lambda_image[w]
@@ -1168,16 +1361,22 @@ class Delta(QSO):
         The projection gets rid of the distortion caused by the continuum
         fitiing. See equations 5 and 6 of du Mas des Bourboux et al. 2020
         """
+        # the weighted deltas and the sum of weights are shared by the
+        # 2nd and 3rd terms
+        weighted_delta = self.weights * self.delta
+        sum_weights = self.weights.sum()
+
         # 2nd term in equation 6
-        mean_delta = np.average(self.delta, weights=self.weights)
+        mean_delta = weighted_delta.sum() / sum_weights
 
         # 3rd term in equation 6
         res = 0
         if (self.order == 1) and self.delta.shape[0] > 1:
-            mean_log_lambda = np.average(self.log_lambda, weights=self.weights)
+            mean_log_lambda = (self.weights *
+                               self.log_lambda).sum() / sum_weights
             meanless_log_lambda = self.log_lambda - mean_log_lambda
             mean_delta_log_lambda = (
-                np.sum(self.weights * self.delta * meanless_log_lambda) /
+                np.sum(weighted_delta * meanless_log_lambda) /
                 np.sum(self.weights * meanless_log_lambda**2))
             res = mean_delta_log_lambda * meanless_log_lambda
         elif self.order == 1:
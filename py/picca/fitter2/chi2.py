@@ -16,7 +16,8 @@ class chi2:
     def __init__(self,dic_init):
         self.zeff = dic_init['data sets']['zeff']
         self.data = dic_init['data sets']['data']
-        self.par_names = np.unique([name for d in self.data for name in d.par_names])
+        self.par_names = np.array(
+            sorted(set().union(*[d.par_names for d in self.data])))
         self.outfile = os.path.expandvars(dic_init['outfile'])
 
         self.k = dic_init['fiducial']['k']
@@ -225,7 +226,7 @@ class chi2:
             d.ico = d.ico/s
             # no need to compute Cholesky when computing forecast
             if not self.forecast_mc:
-                d.cho = cholesky(d.co)
+                d.cho = cholesky(d.co, lower=True, check_finite=False)
 
         self.fiducial_values = dict(self.best_fit.values).copy()
         for p in self.fidfast_mc:
@@ -250,17 +251,19 @@ class chi2:
             self.fiducial_values['sigmaNL_par'] = snl_par
         del self.fiducial_values['SB']
 
+        # if computing forecast, do not add randomness
+        if not self.forecast_mc:
+            mocks = self._draw_mocks(nfast_mc)
+
         self.fast_mc = {}
         self.fast_mc['chi2'] = []
         self.fast_mc_data = {}
         for it in range(nfast_mc):
-            for d in self.data:
-                # if computing forecast, do not add randomness
+            for index, d in enumerate(self.data):
                 if self.forecast_mc:
                     d.da = d.fiducial_model
                 else:
-                    g = np.random.randn(len(d.da))
-                    d.da = d.cho.dot(g) + d.fiducial_model
+                    d.da = mocks[index][it]
                 self.fast_mc_data[d.name+'_'+str(it)] = d.da
                 d.da_cut = d.da[d.mask]
 
@@ -272,6 +275,19 @@ class chi2:
             self.fast_mc['chi2'].append(best_fit.fval)
             sys.stderr.write("\nINFO: finished fastMC iteration {} of {}\n".format(it+1,nfast_mc))
 
+    def _draw_mocks(self, nfast_mc):
+        ''' Draw the correlated mocks of all the fastMC iterations at once '''
+        # the Gaussian variables come in the same order as drawing them
+        # one iteration and one data set at a time
+        num_bins = [len(d.da) for d in self.data]
+        draws = np.random.randn(nfast_mc, sum(num_bins))
+        mocks = []
+        start = 0
+        for d, num in zip(self.data, num_bins):
+            mocks.append(draws[:, start:start+num].dot(d.cho.T) + d.fiducial_model)
+            start += num
+        return mocks
+
     def minos(self):
         if not hasattr(self,"minos_para"): return
 
@@ -268,7 +268,7 @@ class fitter2_mpi(control.fitter2):
         for d, s in zip(self.chi2.data, self.chi2.scalefast_mc):
             d.co = s*d.co
             d.ico = d.ico/s
-            d.cho = cholesky(d.co)
+            d.cho = cholesky(d.co, lower=True, check_finite=False)
 
         # Initialize fiducial values
         self.chi2.fiducial_values = dict(self.chi2.best_fit.values).copy()
@@ -305,10 +305,10 @@ class fitter2_mpi(control.fitter2):
         self.chi2.fast_mc = {}
         self.chi2.fast_mc['chi2'] = []
         self.chi2.fast_mc_data = {}
+        mocks = self.chi2._draw_mocks(nfast_mc)
         for it in range(nfast_mc):
-            for d in self.chi2.data:
-                g = np.random.randn(len(d.da))
-                d.da = d.cho.dot(g) + d.fiducial_model
+            for index, d in enumerate(self.chi2.data):
+                d.da = mocks[index][it]
                 self.chi2.fast_mc_data[d.name+'_'+str(it)] = d.da
                 d.da_cut = d.da[d.mask]
 
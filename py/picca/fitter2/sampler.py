@@ -3,7 +3,6 @@ import os.path
 import numpy as np
 import pypolychord
 from pypolychord.settings import PolyChordSettings
-from pypolychord.priors import UniformPrior
 
 from . import priors
 
@@ -15,7 +14,8 @@ class sampler:
         # Setup the data we need and extract the PolyChord config
         self.zeff = dic_init['data sets']['zeff']
         self.data = dic_init['data sets']['data']
-        self.par_names = np.unique([name for d in self.data for name in d.par_names])
+        self.par_names = np.array(
+            sorted(set().union(*[d.par_names for d in self.data])))
         self.outfile = os.path.expandvars(dic_init['outfile'])
         self.polychord_setup = dic_init['Polychord']
 
@@ -67,21 +67,25 @@ class sampler:
         limits = np.array([list(lim_dict.values())[i] for i in sampled_pars_ind])
         names = np.array([list(par_names.values())[i] for i in sampled_pars_ind])
 
+        # Every call overwrites all the sampled parameters, so the same
+        # dictionary can be reused instead of copying val_dict each time
+        pars = val_dict.copy()
+
         def log_lik(theta):
             ''' Wrapper for likelihood function passed to Polychord '''
-            pars = val_dict.copy()
-            for i, name in enumerate(names):
-                pars[name] = theta[i]
+            for name, value in zip(names, theta):
+                pars[name] = value
 
             log_lik = self.log_lik(pars)
             return log_lik, []
 
+        # Bounds of the uniform prior, fixed for the whole run
+        lower_limits = limits[:, 0].astype(float)
+        limits_width = limits[:, 1].astype(float) - lower_limits
+
         def prior(hypercube):
             ''' Uniform prior '''
-            prior = []
-            for i, lims in enumerate(limits):
-                prior.append(UniformPrior(lims[0], lims[1])(hypercube[i]))
-            return prior
+            return (lower_limits + limits_width * np.asarray(hypercube)).tolist()
 
         def dumper(live, dead, logweights, logZ, logZerr):
             ''' Dumper function empty for now '''
@@ -6,12 +6,16 @@ This module several functions to read different types of data:
     - read_drq
     - read_dust_map
     - read_data
+    - read_healpix
     - read_from_spec
+    - read_spec_object
     - read_from_mock_1d
     - read_from_pix
     - read_from_spcframe
+    - read_spplate
     - read_from_spplate
     - read_from_desi
+    - read_delta_file
     - read_deltas
     - read_objects
 See the respective documentation for details
@@ -20,7 +24,9 @@ import glob
 import sys
 import time
 import os.path
-import copy
+import multiprocessing
+from collections import defaultdict
+from io import StringIO
 import numpy as np
 import healpy
 import fitsio
@@ -52,22 +58,24 @@ def read_dlas(filename):
     userprint('Reading DLA catalog from:', filename)
     columns_list = ['THING_ID', 'Z', 'NHI']
     hdul = fitsio.FITS(filename)
-    cat = {col: hdul['DLACAT'][col][:] for col in columns_list}
+    # read all the columns in a single pass over the table
+    data = hdul['DLACAT'].read(columns=columns_list)
+    cat = {col: data[col] for col in columns_list}
     hdul.close()
 
     # sort the items in the dictionary according to THING_ID and redshift
-    w = np.argsort(cat['Z'])
-    for key in cat.keys():
-        cat[key] = cat[key][w]
-    w = np.argsort(cat['THING_ID'])
-    for key in cat.keys():
-        cat[key] = cat[key][w]
+    order = np.lexsort((cat['Z'], cat['THING_ID']))
+    cat = {key: value[order] for key, value in cat.items()}
 
     # group DLAs on the same line of sight together
-    dlas = {}
-    for thingid in np.unique(cat['THING_ID']):
-        w = (thingid == cat['THING_ID'])
-        dlas[thingid] = list(zip(cat['Z'][w], cat['NHI'][w]))
+    # (after sorting, they are in contiguous runs)
+    thingids, starts = np.unique(cat['THING_ID'], return_index=True)
+    z_abs_groups = np.split(cat['Z'], starts[1:])
+    nhi_groups = np.split(cat['NHI'], starts[1:])
+    dlas = {
+        thingid: list(zip(z_abs, nhi))
+        for thingid, z_abs, nhi in zip(thingids, z_abs_groups, nhi_groups)
+    }
     num_dlas = np.sum([len(dla) for dla in dlas.values()])
 
     userprint(' In catalog: {} DLAs'.format(num_dlas))
@@ -88,30 +96,36 @@ def read_absorbers(filename):
         A dictionary with the absorbers's information. Keys are the THING_ID
         associated with the DLA. Values are a tuple with its redshift and
         column density.
+
+    Raises:
+        ValueError: if a data row is found before the ThingID header line
     """
     userprint('Reading absorbers from:', filename)
-    file = open(filename)
-    absorbers = {}
+    absorbers = defaultdict(list)
     num_absorbers = 0
-    col_names = None
-    for line in file.readlines():
-        cols = line.split()
-        if len(cols) == 0:
-            continue
-        if cols[0][0] == "#":
-            continue
-        if cols[0] == "ThingID":
-            col_names = cols
-            continue
-        if cols[0][0] == "-":
-            continue
-        thingid = int(cols[col_names.index("ThingID")])
-        if thingid not in absorbers:
-            absorbers[thingid] = []
-        lambda_abs = float(cols[col_names.index("lambda")])
-        absorbers[thingid].append(lambda_abs)
-        num_absorbers += 1
-    file.close()
+    thingid_index = None
+    lambda_index = None
+    with open(filename) as file:
+        for line in file:
+            cols = line.split()
+            if len(cols) == 0:
+                continue
+            if cols[0][0] == "#":
+                continue
+            if cols[0] == "ThingID":
+                # look up the relevant columns once per header
+                thingid_index = cols.index("ThingID")
+                lambda_index = cols.index("lambda")
+                continue
+            if cols[0][0] == "-":
+                continue
+            if thingid_index is None or lambda_index is None:
+                raise ValueError(("Found a data row before the ThingID header "
+                                  "line in {}").format(filename))
+            absorbers[int(cols[thingid_index])].append(
+                float(cols[lambda_index]))
+            num_absorbers += 1
+    absorbers = dict(absorbers)
 
     userprint(" In catalog: {} absorbers".format(num_absorbers))
     userprint(" In catalog: {} forests have absorbers".format(len(absorbers)))
@@ -148,7 +162,23 @@ def read_drq(drq_filename,
             Table containing the metadata of the selected objects
     """
     userprint('Reading catalog from ', drq_filename)
-    catalog = Table(fitsio.read(drq_filename, ext=1))
+    # only read the columns needed for the cuts, the metadata columns are
+    # read afterwards for the selected rows only
+    cut_columns = [
+        'RA', 'DEC', 'Z', 'Z_VI', 'THING_ID', 'TARGETID', 'TARGET_RA',
+        'TARGET_DEC', 'BAL_FLAG_VI', 'BI_CIV'
+    ]
+    metadata_columns = [
+        'PLATE', 'MJD', 'FIBERID', 'TILEID', 'PETAL_LOC', 'NIGHT', 'FIBER',
+        'NHI'
+    ]
+    with fitsio.FITS(drq_filename) as hdul:
+        colnames = hdul[1].get_colnames()
+        catalog = Table(hdul[1].read(
+            columns=[column for column in colnames if column in cut_columns]))
+    metadata_columns = [
+        column for column in colnames if column in metadata_columns
+    ]
 
     keep_columns = ['RA', 'DEC', 'Z']
     if 'desi' in mode and 'TARGETID' in catalog.colnames:
@@ -173,31 +203,44 @@ def read_drq(drq_filename,
             return None
 
     ## Sanity checks
+    # cuts are applied on the plain arrays, skipping the astropy Column
+    # machinery, and each cumulative count is a single popcount
     userprint('')
+    ra = catalog['RA'].data
+    dec = catalog['DEC'].data
+    z = catalog['Z'].data
     w = np.ones(len(catalog), dtype=bool)
-    userprint(f" start                 : nb object in cat = {np.sum(w)}")
-    w &= catalog[obj_id_name] > 0
-    userprint(f" and {obj_id_name} > 0       : nb object in cat = {np.sum(w)}")
-    w &= catalog['RA'] != catalog['DEC']
-    userprint(f" and ra != dec         : nb object in cat = {np.sum(w)}")
-    w &= catalog['RA'] != 0.
-    userprint(f" and ra != 0.          : nb object in cat = {np.sum(w)}")
-    w &= catalog['DEC'] != 0.
-    userprint(f" and dec != 0.         : nb object in cat = {np.sum(w)}")
+    userprint(f" start                 : nb object in cat = "
+              f"{np.count_nonzero(w)}")
+    w &= catalog[obj_id_name].data > 0
+    userprint(f" and {obj_id_name} > 0       : nb object in cat = "
+              f"{np.count_nonzero(w)}")
+    w &= ra != dec
+    userprint(f" and ra != dec         : nb object in cat = "
+              f"{np.count_nonzero(w)}")
+    w &= ra != 0.
+    userprint(f" and ra != 0.          : nb object in cat = "
+              f"{np.count_nonzero(w)}")
+    w &= dec != 0.
+    userprint(f" and dec != 0.         : nb object in cat = "
+              f"{np.count_nonzero(w)}")
 
     ## Redshift range
-    w &= catalog['Z'] >= z_min
-    userprint(f" and z >= {z_min}        : nb object in cat = {np.sum(w)}")
-    w &= catalog['Z'] < z_max
-    userprint(f" and z < {z_max}         : nb object in cat = {np.sum(w)}")
+    w &= z >= z_min
+    userprint(f" and z >= {z_min}        : nb object in cat = "
+              f"{np.count_nonzero(w)}")
+    w &= z < z_max
+    userprint(f" and z < {z_max}         : nb object in cat = "
+              f"{np.count_nonzero(w)}")
 
     ## BAL visual
     if not keep_bal and bi_max is None:
         if 'BAL_FLAG_VI' in catalog.colnames:
-            bal_flag = catalog['BAL_FLAG_VI']
+            bal_flag = catalog['BAL_FLAG_VI'].data
             w &= bal_flag == 0
             userprint(
-                f" and BAL_FLAG_VI == 0  : nb object in cat = {np.sum(w)}")
+                f" and BAL_FLAG_VI == 0  : nb object in cat = "
+                f"{np.count_nonzero(w)}")
             keep_columns += ['BAL_FLAG_VI']
         else:
             userprint("WARNING: BAL_FLAG_VI not found")
@@ -205,22 +248,28 @@ def read_drq(drq_filename,
     ## BAL CIV
     if bi_max is not None:
         if 'BI_CIV' in catalog.colnames:
-            bi = catalog['BI_CIV']
+            bi = catalog['BI_CIV'].data
             w &= bi <= bi_max
             userprint(
-                f" and BI_CIV <= {bi_max}  : nb object in cat = {np.sum(w)}")
+                f" and BI_CIV <= {bi_max}  : nb object in cat = "
+                f"{np.count_nonzero(w)}")
             keep_columns += ['BI_CIV']
         else:
             userprint("ERROR: --bi-max set but no BI_CIV field in HDU")
             sys.exit(0)
 
     #-- DLA Column density
-    if 'NHI' in catalog.colnames:
+    if 'NHI' in metadata_columns:
         keep_columns += ['NHI']
 
-    catalog.keep_columns(keep_columns)
-    w = np.where(w)[0]
     catalog = catalog[w]
+    if len(metadata_columns) > 0:
+        with fitsio.FITS(drq_filename) as hdul:
+            metadata = hdul[1].read(columns=metadata_columns,
+                                    rows=np.flatnonzero(w))
+        for column in metadata_columns:
+            catalog[column] = metadata[column]
+    catalog.keep_columns(keep_columns)
 
     #-- Convert angles to radians
     catalog['RA'] = np.radians(catalog['RA'])
@@ -244,7 +293,7 @@ def read_dust_map(drq_filename, extinction_conversion_r=3.793):
         associated with the observation. Values are the extinction for that
         line of sight.
     """
-    hdu = fitsio.read(drq_filename, ext=1)
+    hdu = fitsio.read(drq_filename, ext=1, columns=['THING_ID', 'EXTINCTION'])
     thingid = hdu['THING_ID']
     ext = hdu['EXTINCTION'][:, 1] / extinction_conversion_r
     return dict(zip(thingid, ext))
@@ -262,7 +311,8 @@ def read_data(in_dir,
               best_obs=False,
               single_exp=False,
               pk1d=None,
-              spall=None):
+              spall=None,
+              nproc=None):
     """Reads the spectra and formats its data as Forest instances.
 
     Args:
@@ -299,6 +349,11 @@ def read_data(in_dir,
             Format for Pk 1D: Pk1D
         spall: str - default: None
             Path to the spAll file required for multiple observations
+        nproc: int or None - default: None
+            Number of processes used to read the healpixs in modes 'pix' and
+            'spec-mock-1D', the plates in mode 'spplate', or the objects in
+            modes 'spec' and 'corrected-spec'. If None or 1, they are read
+            serially.
 
     Returns:
         The following variables:
@@ -317,14 +372,23 @@ def read_data(in_dir,
                        keep_bal=keep_bal,
                        bi_max=bi_max,
                        mode=mode)
+    # polar angles of the quasars, shared by the healpix computations below
+    theta = np.pi / 2 - catalog['DEC'].data
 
     # if there is a maximum number of spectra, make sure they are selected
     # in a contiguous regions
     if max_num_spec is not None:
         ## choose them in a small number of pixels
-        healpixs = healpy.ang2pix(16, np.pi / 2 - catalog['DEC'], catalog['RA'])
-        sorted_healpix = np.argsort(healpixs)
-        catalog = catalog[sorted_healpix][:max_num_spec]
+        healpixs = healpy.ang2pix(16, theta, catalog['RA'].data)
+        if max_num_spec < len(catalog):
+            # only the selected objects need to be fully sorted
+            selected = np.argpartition(healpixs,
+                                       max_num_spec - 1)[:max_num_spec]
+            selected = selected[np.argsort(healpixs[selected])]
+        else:
+            selected = np.argsort(healpixs)
+        catalog = catalog[selected]
+        theta = theta[selected]
 
     data = {}
     num_data = 0
@@ -343,22 +407,24 @@ def read_data(in_dir,
                                          catalog,
                                          log_file=log_file,
                                          best_obs=best_obs,
-                                         spall=spall)
+                                         spall=spall,
+                                         nproc=nproc)
         else:
             pix_data = read_from_spec(in_dir,
                                       catalog,
                                       mode=mode,
                                       pk1d=pk1d,
                                       best_obs=best_obs,
-                                      spall=spall)
+                                      spall=spall,
+                                      nproc=nproc)
         ra = np.array([d.ra for d in pix_data])
         dec = np.array([d.dec for d in pix_data])
         nside, healpixs = find_nside(ra, dec)
-        for index, healpix in enumerate(healpixs):
-            if healpix not in data:
-                data[healpix] = []
-            data[healpix].append(pix_data[index])
-            num_data += 1
+        data = defaultdict(list)
+        for healpix, forest in zip(healpixs, pix_data):
+            data[healpix].append(forest)
+        data = dict(data)
+        num_data = len(pix_data)
 
     elif mode in ["pix", "spec-mock-1D"]:
         data = {}
@@ -381,28 +447,34 @@ def read_data(in_dir,
                         sys.exit(1)
             nside = hdul[1].read_header()['NSIDE']
             hdul.close()
-            healpixs = healpy.ang2pix(nside, np.pi / 2 - catalog['DEC'].data,
-                                      catalog['RA'].data)
+            healpixs = healpy.ang2pix(nside, theta, catalog['RA'].data)
         else:
             nside, healpixs = find_nside(catalog['RA'].data,
                                          catalog['DEC'].data)
 
-        unique_healpix = np.unique(healpixs)
+        # group the objects by healpix with a single (stable) sort so that
+        # they keep the catalog order within each healpix
+        sort_index = np.argsort(healpixs, kind='stable')
+        unique_healpix, first_index = np.unique(healpixs[sort_index],
+                                                return_index=True)
+        healpix_indexs = np.split(sort_index, first_index[1:])
+
+        # the opened log file cannot be shared with other processes, so each
+        # healpix is logged to a buffer that is written here
+        parallel = nproc is not None and nproc > 1
+        tasks = [(mode, in_dir, healpix, catalog[indexs], log_file is not None)
+                 for healpix, indexs in zip(unique_healpix, healpix_indexs)]
+        if parallel:
+            context = multiprocessing.get_context('fork')
+            pool = context.Pool(processes=nproc)
+            results = pool.imap(read_healpix, tasks)
+        else:
+            results = map(read_healpix, tasks)
 
-        for index, healpix in enumerate(unique_healpix):
-            w = healpixs == healpix
-            t0 = time.time()
-            if mode == "pix":
-                pix_data = read_from_pix(in_dir,
-                                         healpix,
-                                         catalog[w],
-                                         log_file=log_file)
-            elif mode == "spec-mock-1D":
-                pix_data = read_from_mock_1d(in_dir,
-                                             catalog[w],
-                                             log_file=log_file)
-            read_time = time.time() - t0
-            read_time /= (len(pix_data) + 1e-3)
+        for index, (healpix, (pix_data, read_time, log)) in enumerate(
+                zip(unique_healpix, results)):
+            if log_file is not None:
+                log_file.write(log)
             if not pix_data is None:
                 userprint(("{} read from pix {}, {} {} in {} secs per"
                            "spectrum").format(len(pix_data), healpix, index,
@@ -411,6 +483,10 @@ def read_data(in_dir,
                 data[healpix] = pix_data
                 num_data += len(pix_data)
 
+        if parallel:
+            pool.close()
+            pool.join()
+
     elif mode == "desiminisv":
         nside = 8
         data, num_data = read_from_minisv_desi(in_dir, catalog, pk1d=pk1d)
@@ -421,6 +497,36 @@ def read_data(in_dir,
     return data, num_data, nside, "RING"
 
 
+def read_healpix(arguments):
+    """Reads the spectra of a single healpix in modes 'pix' and 'spec-mock-1D'.
+
+    Args:
+        arguments: tuple
+            The open mode, the directory (or file for 'spec-mock-1D') of the
+            spectra, the healpix number, the catalogue of the objects in the
+            healpix and whether to log the reading
+
+    Returns:
+        The following variables:
+            pix_data: List of read spectra, or None if the healpix could not be
+                read
+            read_time: Time spent reading the healpix per spectrum
+            log: Log of the reading (empty if not requested)
+    """
+    mode, in_dir, healpix, catalog, log = arguments
+    log_file = StringIO() if log else None
+    t0 = time.time()
+    if mode == "pix":
+        pix_data = read_from_pix(in_dir, healpix, catalog, log_file=log_file)
+    else:
+        pix_data = read_from_mock_1d(in_dir, catalog, log_file=log_file)
+    read_time = time.time() - t0
+    if pix_data is not None:
+        read_time /= (len(pix_data) + 1e-3)
+    log = log_file.getvalue() if log else ""
+    return pix_data, read_time, log
+
+
 def find_nside(ra, dec):
     """Determines nside such that there are 1000 objs per pixel on average.
 
@@ -436,16 +542,23 @@ def find_nside(ra, dec):
     ## determine nside such that there are 1000 objs per pixel on average
     userprint("determining nside")
     nside = 256
-    healpixs = healpy.ang2pix(nside, np.pi / 2 - dec, ra)
-    mean_num_obj = len(healpixs) / len(np.unique(healpixs))
+    # in the NESTED scheme the pixel containing a given pixel at nside/2 is
+    # obtained by dropping its last two bits, so the positions are only
+    # converted to pixels once
+    healpixs_nest = healpy.ang2pix(nside, np.pi / 2 - dec, ra, nest=True)
+    # the number of occupied pixels is counted without sorting
+    mean_num_obj = (len(healpixs_nest) /
+                    np.count_nonzero(np.bincount(healpixs_nest)))
     target_mean_num_obj = 500
     nside_min = 8
     while mean_num_obj < target_mean_num_obj and nside >= nside_min:
         nside //= 2
-        healpixs = healpy.ang2pix(nside, np.pi / 2 - dec, ra)
-        mean_num_obj = len(healpixs) / len(np.unique(healpixs))
+        healpixs_nest >>= 2
+        mean_num_obj = (len(healpixs_nest) /
+                        np.count_nonzero(np.bincount(healpixs_nest)))
     userprint("nside = {} -- mean #obj per pixel = {}".format(
         nside, mean_num_obj))
+    healpixs = healpy.nest2ring(nside, healpixs_nest)
 
     return nside, healpixs
 
@@ -455,7 +568,8 @@ def read_from_spec(in_dir,
                    mode,
                    pk1d=None,
                    best_obs=False,
-                   spall=None):
+                   spall=None,
+                   nproc=None):
     """Reads the spectra from the individual SDSS spectrum format,
        spec-PLATE-MJD-FIBERID.fits,
        and formats its data as Forest instances.
@@ -474,6 +588,9 @@ def read_from_spec(in_dir,
             observations
         spall: str - default: None
             Path to the spAll file required for multiple observations
+        nproc: int or None - default: None
+            Number of processes used to read the objects. If None or 1, the
+            objects are read serially
 
     Returns:
         List of read spectra for all the healpixs
@@ -485,16 +602,27 @@ def read_from_spec(in_dir,
     if not best_obs:
         (thing_id_all, plate_all, mjd_all,
          fiberid_all) = read_spall(in_dir, catalog['THING_ID'], spall=spall)
+        # group the observations of each object (keeping their order in
+        # spAll) instead of scanning all of them for every object
+        sorted_index_all = np.argsort(thing_id_all, kind='stable')
+        sorted_thing_id_all = thing_id_all[sorted_index_all]
+        first_index = np.searchsorted(sorted_thing_id_all,
+                                      catalog['THING_ID'].data,
+                                      side='left')
+        last_index = np.searchsorted(sorted_thing_id_all,
+                                     catalog['THING_ID'].data,
+                                     side='right')
 
     userprint(f"Reading {len(catalog)} objects")
 
-    pix_data = []
-    #-- Loop over unique objects
-    for i in range(len(catalog)):
-        thing_id = catalog['THING_ID'][i]
+    spec_columns = ["loglam", "flux", "ivar", "and_mask"]
+    if pk1d is not None:
+        spec_columns.append("wdisp")
 
+    tasks = []
+    for i in range(len(catalog)):
         if not best_obs:
-            w = thing_id_all == thing_id
+            w = sorted_index_all[first_index[i]:last_index[i]]
             plates = plate_all[w]
             mjds = mjd_all[w]
             fibers = fiberid_all[w]
@@ -503,57 +631,95 @@ def read_from_spec(in_dir,
             plates = [metadata['PLATE']]
             mjds = [metadata['MJD']]
             fibers = [metadata['FIBERID']]
+        tasks.append((in_dir, mode, spec_columns, pk1d, catalog['THING_ID'][i],
+                      catalog['RA'][i], catalog['DEC'][i], catalog['Z'][i],
+                      plates, mjds, fibers))
+
+    #-- Objects are read by a pool of processes if requested
+    parallel = nproc is not None and nproc > 1
+    if parallel:
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(processes=nproc)
+        results = pool.imap(read_spec_object, tasks)
+    else:
+        results = map(read_spec_object, tasks)
 
-        deltas = None
-        #-- Loop over all plate, mjd, fiberid for this object
-        for plate, mjd, fiberid in zip(plates, mjds, fibers):
-            filename = f'{in_dir}/{plate}/{mode}-{plate}-{mjd}-{fiberid:04d}.fits'
-            try:
-                hdul = fitsio.FITS(filename)
-            except IOError:
-                userprint("Error reading {}".format(filename))
-                continue
-            userprint("Read {}".format(filename))
-
-            log_lambda = hdul[1]["loglam"][:]
-            flux = hdul[1]["flux"][:]
-            ivar = hdul[1]["ivar"][:] * (hdul[1]["and_mask"][:] == 0)
-
-            #-- Define dispersion and resolution for pk1d
-            if pk1d is not None:
-                #-- Compute difference between exposure
-                exposures_diff = exp_diff(hdul, log_lambda)
-                #-- Compute spectral resolution
-                wdisp = hdul[1]["wdisp"][:]
-                reso = spectral_resolution(wdisp, True, fiberid, log_lambda)
-            else:
-                exposures_diff = None
-                reso = None
-
-            forest = Forest(log_lambda,
-                            flux,
-                            ivar,
-                            thing_id,
-                            catalog['RA'][i],
-                            catalog['DEC'][i],
-                            catalog['Z'][i],
-                            plate,
-                            mjd,
-                            fiberid,
-                            exposures_diff=exposures_diff,
-                            reso=reso)
-            if deltas is None:
-                deltas = forest
-            else:
-                deltas.coadd(forest)
-            hdul.close()
+    pix_data = [forest for forest in results if forest is not None]
 
-        if deltas is not None:
-            pix_data.append(deltas)
+    if parallel:
+        pool.close()
+        pool.join()
 
     return pix_data
 
 
+def read_spec_object(arguments):
+    """Reads and coadds all the observations of a single object in the
+    individual SDSS spectrum format.
+
+    Args:
+        arguments: tuple
+            The directory to the spectra files, the open mode, the columns
+            to read, the format for Pk 1D, the thingid, right ascension,
+            declination and redshift of the object, and the plates, mjds and
+            fiberids of its observations
+
+    Returns:
+        The coadded forest, or None if no observation could be read
+    """
+    (in_dir, mode, spec_columns, pk1d, thing_id, ra, dec, z_qso, plates, mjds,
+     fibers) = arguments
+
+    forests = []
+    #-- Loop over all plate, mjd, fiberid for this object
+    for plate, mjd, fiberid in zip(plates, mjds, fibers):
+        filename = f'{in_dir}/{plate}/{mode}-{plate}-{mjd}-{fiberid:04d}.fits'
+        try:
+            hdul = fitsio.FITS(filename)
+        except IOError:
+            userprint("Error reading {}".format(filename))
+            continue
+        userprint("Read {}".format(filename))
+
+        #-- Read all the required columns in a single call
+        spectrum = hdul[1].read(columns=spec_columns)
+        log_lambda = spectrum["loglam"]
+        flux = spectrum["flux"]
+        ivar = spectrum["ivar"]
+        ivar *= (spectrum["and_mask"] == 0)
+
+        #-- Define dispersion and resolution for pk1d
+        if pk1d is not None:
+            #-- Compute difference between exposure
+            exposures_diff = exp_diff(hdul, log_lambda)
+            #-- Compute spectral resolution
+            wdisp = spectrum["wdisp"]
+            reso = spectral_resolution(wdisp, True, fiberid, log_lambda)
+        else:
+            exposures_diff = None
+            reso = None
+
+        forest = Forest(log_lambda,
+                        flux,
+                        ivar,
+                        thing_id,
+                        ra,
+                        dec,
+                        z_qso,
+                        plate,
+                        mjd,
+                        fiberid,
+                        exposures_diff=exposures_diff,
+                        reso=reso)
+        forests.append(forest)
+        hdul.close()
+
+    #-- Coadd all the observations of this object in a single pass
+    if len(forests) == 0:
+        return None
+    return forests[0].coadd(forests[1:])
+
+
 def read_from_mock_1d(filename, catalog, log_file=None):
     """Reads the spectra and formats its data as Forest instances.
 
@@ -630,53 +796,77 @@ def read_from_pix(in_dir, healpix, catalog, log_file=None):
     """
     warnings.warn("this method will be deprecated.", DeprecationWarning)
 
+    # prefer the uncompressed file, which does not need to be decompressed
+    # on every open
     try:
-        filename = in_dir + "/pix_{}.fits.gz".format(healpix)
+        filename = in_dir + "/pix_{}.fits".format(healpix)
         hdul = fitsio.FITS(filename)
     except IOError:
         try:
-            filename = in_dir + "/pix_{}.fits".format(healpix)
+            filename = in_dir + "/pix_{}.fits.gz".format(healpix)
             hdul = fitsio.FITS(filename)
         except IOError:
             userprint("error reading {}".format(healpix))
             return None
 
+    # index of the first spectrum of each requested thingid in the file,
+    # found for all the objects at once on the sorted thingids
+    thingids, thingid_index = np.unique(hdul[0][:], return_index=True)
+    catalog_thingids = catalog['THING_ID'].data
+    if thingids.size > 0:
+        pos = np.searchsorted(thingids, catalog_thingids)
+        pos = pos.clip(max=thingids.size - 1)
+        found = thingids[pos] == catalog_thingids
+        indexs = thingid_index[pos]
+    else:
+        found = np.zeros(len(catalog), dtype=bool)
+        indexs = np.zeros(len(catalog), dtype=int)
+
     ## fill log
     if log_file is not None:
-        for t in catalog['THING_ID']:
-            if t not in hdul[0][:]:
-                log_file.write("{} missing from pixel {}\n".format(t, healpix))
-                userprint("{} missing from pixel {}".format(t, healpix))
+        for t in catalog_thingids[~found]:
+            log_file.write("{} missing from pixel {}\n".format(t, healpix))
+            userprint("{} missing from pixel {}".format(t, healpix))
 
     pix_data = []
-    thingid_list = list(hdul[0][:])
-    thingid2index = {
-        t: thingid_list.index(t)
-        for t in catalog['THING_ID']
-        if t in thingid_list
-    }
+    if not found.any():
+        for thingid in catalog_thingids:
+            if log_file is not None:
+                log_file.write("{} missing from pixel {}\n".format(
+                    thingid, healpix))
+            userprint("{} missing from pixel {}".format(thingid, healpix))
+        hdul.close()
+        return pix_data
+
+    # only read the range of spectra spanned by the requested objects,
+    # store one spectrum per contiguous row and apply the mask in one pass
+    first_index = indexs[found].min()
+    last_index = indexs[found].max() + 1
     log_lambda = hdul[1][:]
-    flux = hdul[2].read()
-    ivar = hdul[3].read()
-    mask = hdul[4].read()
-    for entry in catalog:
-        try:
-            index = thingid2index[entry['THING_ID']]
-        except KeyError:
+    flux = np.ascontiguousarray(hdul[2][:, first_index:last_index].T)
+    ivar = np.ascontiguousarray(hdul[3][:, first_index:last_index].T)
+    ivar *= (hdul[4][:, first_index:last_index].T == 0)
+    hdul.close()
+
+    # the metadata is taken from plain arrays rather than astropy rows, and
+    # all the forests share the same wavelength array
+    metadata = zip(catalog_thingids, catalog['RA'].data, catalog['DEC'].data,
+                   catalog['Z'].data, catalog['PLATE'].data,
+                   catalog['MJD'].data, catalog['FIBERID'].data)
+    for (thingid, ra, dec, z_qso, plate, mjd,
+         fiberid), is_found, index in zip(metadata, found, indexs):
+        if not is_found:
             if log_file is not None:
                 log_file.write("{} missing from pixel {}\n".format(
-                    entry['THING_ID'], healpix))
-            userprint("{} missing from pixel {}".format(entry['THING_ID'],
-                                                        healpix))
+                    thingid, healpix))
+            userprint("{} missing from pixel {}".format(thingid, healpix))
             continue
+        index -= first_index
         pix_data.append(
-            Forest(log_lambda, flux[:, index],
-                   ivar[:, index] * (mask[:, index] == 0), entry['THING_ID'],
-                   entry['RA'], entry['DEC'], entry['Z'], entry['PLATE'],
-                   entry['MJD'], entry['FIBERID']))
+            Forest(log_lambda, flux[index], ivar[index], thingid, ra, dec,
+                   z_qso, plate, mjd, fiberid))
         if log_file is not None:
-            log_file.write("{} read\n".format(entry['THING_ID']))
-    hdul.close()
+            log_file.write("{} read\n".format(thingid))
 
     return pix_data
 
@@ -714,28 +904,14 @@ def read_from_spcframe(in_dir, catalog, log_file=None, single_exp=False):
     mjd = catalog['MJD'].data
     fiberid = catalog['FIBERID'].data
 
-    # store all the metadata in a single variable
-    all_metadata = []
-    for t, r, d, z, p, m, f in zip(thingid, ra, dec, z_qso, plate, mjd,
-                                   fiberid):
-        metadata = {}
-        metadata['thingid'] = t
-        metadata['ra'] = r
-        metadata['dec'] = d
-        metadata['z_qso'] = z
-        metadata['plate'] = p
-        metadata['mjd'] = m
-        metadata['fiberid'] = f
-        all_metadata.append(metadata)
-
-    # group the metadata with respect to their plate and mjd
-    platemjd = {}
-    for index in range(len(thingid)):
-        if (plate[index], mjd[index]) not in platemjd:
-            platemjd[(plate[index], mjd[index])] = []
-        platemjd[(plate[index], mjd[index])].append(all_metadata[index])
-
-    pix_data = {}
+    # group the catalog rows with respect to their plate and mjd
+    platemjd = defaultdict(list)
+    for index, key in enumerate(zip(plate, mjd)):
+        platemjd[key].append(index)
+    platemjd = {key: np.array(indexs) for key, indexs in platemjd.items()}
+
+    # exposures of each object, coadded once all the plates are read
+    pix_data = defaultdict(list)
     userprint("reading {} plates".format(len(platemjd)))
 
     for key in platemjd:
@@ -786,28 +962,27 @@ def read_from_spcframe(in_dir, catalog, log_file=None, single_exp=False):
                                    "/{}/spCFrame-{}.fits".format(p, exp))
 
             flux = spcframe[0].read()
-            ivar = spcframe[1].read() * (spcframe[2].read() == 0)
+            ivar = spcframe[1].read()
+            ivar *= (spcframe[2].read() == 0)
             log_lambda = spcframe[3].read()
 
             ## now convert all those fluxes into forest objects
-            for metadata in platemjd[key]:
-                if spectro == 1 and metadata['fiberid'] > 500:
-                    continue
-                if spectro == 2 and metadata['fiberid'] <= 500:
-                    continue
-                index = (metadata['fiberid'] - 1) % 500
-                t = metadata['thingid']
-                r = metadata['ra']
-                d = metadata['dec']
-                z = metadata['z_qso']
-                f = metadata['fiberid']
-                if t in pix_data:
-                    pix_data[t].coadd(
-                        Forest(log_lambda[index], flux[index], ivar[index], t,
-                               r, d, z, p, m, f))
-                else:
-                    pix_data[t] = Forest(log_lambda[index], flux[index],
-                                         ivar[index], t, r, d, z, p, m, f)
+            # keep the objects observed with this spectrograph
+            indexs = platemjd[key]
+            if spectro == 1:
+                indexs = indexs[fiberid[indexs] <= 500]
+            else:
+                indexs = indexs[fiberid[indexs] > 500]
+            for catalog_index in indexs:
+                f = fiberid[catalog_index]
+                index = (f - 1) % 500
+                t = thingid[catalog_index]
+                r = ra[catalog_index]
+                d = dec[catalog_index]
+                z = z_qso[catalog_index]
+                pix_data[t].append(
+                    Forest(log_lambda[index], flux[index], ivar[index], t, r,
+                           d, z, p, m, f))
                 if log_file is not None:
                     log_file.write(("{} read from exp {} and"
                                     " mjd {}\n").format(t, exp, m))
@@ -820,16 +995,68 @@ def read_from_spcframe(in_dir, catalog, log_file=None, single_exp=False):
                                        len(pix_data), len(thingid)))
             spcframe.close()
 
-    data = list(pix_data.values())
+    # coadd all the exposures of each object in a single pass
+    data = [forests[0].coadd(forests[1:]) for forests in pix_data.values()]
 
     return data
 
 
+def read_spplate(arguments):
+    """Reads the spectra of the requested objects in a single spPlate file.
+
+    Args:
+        arguments: tuple
+            The directory to the spectra files, the plate and mjd of the file,
+            and the thingid, fiberid, right ascension, declination and
+            redshift of the objects to read
+
+    Returns:
+        The following variables:
+            plate_data: List of read spectra, or None if the file could not be
+                read
+            time_read: Time spent reading the file per spectrum
+    """
+    in_dir, p, m, thing_ids, fiberids, ra, dec, z_qso = arguments
+    spplate = f'{in_dir}/{p}/spPlate-{p:04d}-{m}.fits'
+
+    try:
+        hdul = fitsio.FITS(spplate)
+        header = hdul[0].read_header()
+    except IOError:
+        return None, 0.
+
+    t0 = time.time()
+
+    coeff0 = header["COEFF0"]
+    coeff1 = header["COEFF1"]
+
+    #-- Only read the range of fibers spanned by the requested objects
+    first_fiber = fiberids.min()
+    last_fiber = fiberids.max()
+    flux = hdul[0][first_fiber - 1:last_fiber, :]
+    ivar = hdul[1][first_fiber - 1:last_fiber, :]
+    ivar *= (hdul[2][first_fiber - 1:last_fiber, :] == 0)
+    log_lambda = coeff0 + coeff1 * np.arange(flux.shape[1])
+    hdul.close()
+
+    #-- Loop over all objects inside this spPlate file
+    #-- and create the Forest objects
+    plate_data = []
+    for t, f, r, d, z in zip(thing_ids, fiberids, ra, dec, z_qso):
+        i = f - first_fiber
+        plate_data.append(
+            Forest(log_lambda, flux[i], ivar[i], t, r, d, z, p, m, f))
+
+    time_read = (time.time() - t0) / (len(plate_data) + 1e-3)
+    return plate_data, time_read
+
+
 def read_from_spplate(in_dir,
                       catalog,
                       log_file=None,
                       best_obs=False,
-                      spall=None):
+                      spall=None,
+                      nproc=None):
     """Reads the spectra and formats its data as Forest instances.
 
     Args:
@@ -844,6 +1071,9 @@ def read_from_spplate(in_dir,
             observations
         spall: str - default: None
             Path to the spAll file required for multiple observations
+        nproc: int or None - default: None
+            Number of processes used to read the plates. If None or 1, the
+            plates are read serially
 
     Returns:
         List of read spectra for all the healpixs
@@ -856,78 +1086,67 @@ def read_from_spplate(in_dir,
         thing_id_all, plate_all, mjd_all, fiberid_all = read_spall(
             in_dir, catalog['THING_ID'], spall=spall)
     else:
-        thing_id_all = catalog['THING_ID']
-        plate_all = catalog['PLATE']
-        mjd_all = catalog['MJD']
-        fiberid_all = catalog['FIBERID']
+        thing_id_all = catalog['THING_ID'].data
+        plate_all = catalog['PLATE'].data
+        mjd_all = catalog['MJD'].data
+        fiberid_all = catalog['FIBERID'].data
 
     #-- Helper to find information on catalog
     index = np.argsort(catalog['THING_ID'].data)
     sorted_index = np.searchsorted(catalog['THING_ID'][index], thing_id_all)
     index_all_to_catalog = index[sorted_index]
 
-    #-- We will sort all objects by plate-mjd
+    ra = catalog['RA'].data[index_all_to_catalog]
+    dec = catalog['DEC'].data[index_all_to_catalog]
+    z_qso = catalog['Z'].data[index_all_to_catalog]
+
+    #-- We will group all objects by plate-mjd as row indices
     #-- since we want to open each file just once
-    platemjd = {}
-    for i in range(thing_id_all.size):
-        entry = catalog[index_all_to_catalog[i]]
-        p = plate_all[i]
-        m = mjd_all[i]
-        metadata = {k: entry[k] for k in entry.colnames}
-        metadata['PLATE'] = p
-        metadata['MJD'] = m
-        metadata['FIBERID'] = fiberid_all[i]
-        if (p, m) not in platemjd:
-            platemjd[(p, m)] = []
-        platemjd[(p, m)].append(metadata)
+    platemjd = defaultdict(list)
+    for index, key in enumerate(zip(plate_all, mjd_all)):
+        platemjd[key].append(index)
+    platemjd = {key: np.array(indexs) for key, indexs in platemjd.items()}
 
     userprint("reading {} plates".format(len(platemjd)))
 
-    pix_data = {}
-    for key in platemjd:
-        p, m = key
-        spplate = f'{in_dir}/{p}/spPlate-{p:04d}-{m}.fits'
+    tasks = [(in_dir, p, m, thing_id_all[indexs], fiberid_all[indexs],
+              ra[indexs], dec[indexs], z_qso[indexs])
+             for (p, m), indexs in platemjd.items()]
+    #-- Plates are read by a pool of processes while the main process
+    #-- gathers the spectra
+    parallel = nproc is not None and nproc > 1
+    if parallel:
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(processes=nproc)
+        results = pool.imap(read_spplate, tasks)
+    else:
+        results = map(read_spplate, tasks)
 
-        try:
-            hdul = fitsio.FITS(spplate)
-            header = hdul[0].read_header()
-        except IOError:
+    # observations of each object, coadded once all the plates are read
+    pix_data = defaultdict(list)
+    for (p, m), (plate_data, time_read) in zip(platemjd, results):
+        spplate = f'{in_dir}/{p}/spPlate-{p:04d}-{m}.fits'
+        if plate_data is None:
             log_file.write("error reading {}\n".format(spplate))
             continue
 
-        t0 = time.time()
-
-        coeff0 = header["COEFF0"]
-        coeff1 = header["COEFF1"]
-
-        flux = hdul[0].read()
-        ivar = hdul[1].read() * (hdul[2].read() == 0)
-        log_lambda = coeff0 + coeff1 * np.arange(flux.shape[1])
-
-        #-- Loop over all objects inside this spPlate file
-        #-- and create the Forest objects
-        for metadata in platemjd[(p, m)]:
-            t = metadata['THING_ID']
-            i = metadata['FIBERID'] - 1
-            forest = Forest(log_lambda, flux[i], ivar[i], metadata['THING_ID'],
-                            metadata['RA'], metadata['DEC'], metadata['Z'],
-                            metadata['PLATE'], metadata['MJD'],
-                            metadata['FIBERID'])
-            if t in pix_data:
-                pix_data[t].coadd(forest)
-            else:
-                pix_data[t] = forest
+        for forest in plate_data:
+            pix_data[forest.thingid].append(forest)
             if log_file is not None:
-                log_file.write(f"{t} read from file {spplate} and mjd {m}\n")
+                log_file.write(f"{forest.thingid} read from file {spplate} "
+                               f"and mjd {m}\n")
 
-        num_read = len(platemjd[(p, m)])
-        time_read = (time.time() - t0) / (num_read + 1e-3)
+        num_read = len(plate_data)
         userprint(f"INFO: read {num_read} from {os.path.basename(spplate)}" +
                   f" in {time_read:.3f} per spec. " +
                   f" Progress: {len(pix_data)}" + f" of {len(catalog)} ")
-        hdul.close()
 
-    data = list(pix_data.values())
+    if parallel:
+        pool.close()
+        pool.join()
+
+    #-- Coadd all the observations of each object in a single pass
+    data = [forests[0].coadd(forests[1:]) for forests in pix_data.values()]
     return data
 
 
@@ -976,8 +1195,12 @@ def read_from_desi(in_dir, catalog, pk1d=None):
             continue
 
         #-- Read targetid from fibermap to match to catalog later
-        fibermap = hdul['FIBERMAP'].read()
-        targetid_spec = fibermap["TARGETID"]
+        targetid_spec = hdul['FIBERMAP'].read(columns=["TARGETID"])["TARGETID"]
+
+        #-- Map each targetid to the rows of the file containing it
+        targetid2index = defaultdict(list)
+        for index_spec, targetid in enumerate(targetid_spec):
+            targetid2index[targetid].append(index_spec)
 
         #-- First read all wavelength, flux, ivar, mask, and resolution
         #-- from this file
@@ -991,8 +1214,8 @@ def read_from_desi(in_dir, catalog, pk1d=None):
                 spec["log_lambda"] = np.log10(
                     hdul[f"{color}_WAVELENGTH"].read())
                 spec["FL"] = hdul[f"{color}_FLUX"].read()
-                spec["IV"] = (hdul[f"{color}_IVAR"].read() *
-                              (hdul[f"{color}_MASK"].read() == 0))
+                spec["IV"] = hdul[f"{color}_IVAR"].read()
+                spec["IV"] *= (hdul[f"{color}_MASK"].read() == 0)
                 w = np.isnan(spec["FL"]) | np.isnan(spec["IV"])
                 for key in ["FL", "IV"]:
                     spec[key][w] = 0.
@@ -1010,7 +1233,7 @@ def read_from_desi(in_dir, catalog, pk1d=None):
         for entry in catalog[select]:
             #-- Find which row in tile contains this quasar
             #-- It should be there by construction
-            w_t = np.where(targetid_spec == entry[id_name])[0]
+            w_t = targetid2index.get(entry[id_name], [])
             if len(w_t) == 0:
                 userprint(f"Error reading {entry[id_name]}")
                 continue
@@ -1020,7 +1243,7 @@ def read_from_desi(in_dir, catalog, pk1d=None):
                 w_t = w_t[0]
 
             #-- Loop over three spectrograph arms and coadd fluxes
-            forest = None
+            forests = []
             for spec in spec_data.values():
                 ivar = spec['IV'][w_t].copy()
                 flux = spec['FL'][w_t].copy()
@@ -1034,16 +1257,14 @@ def read_from_desi(in_dir, catalog, pk1d=None):
                     reso_in_km_per_s = None
                     exposures_diff = None
 
-                forest_temp = Forest(spec['log_lambda'], flux, ivar,
-                                     entry[id_name], entry['RA'], entry['DEC'],
-                                     entry['Z'], entry[plate_name],
-                                     entry[mjd_name], entry[fiberid_name],
-                                     exposures_diff, reso_in_km_per_s)
+                forests.append(
+                    Forest(spec['log_lambda'], flux, ivar, entry[id_name],
+                           entry['RA'], entry['DEC'], entry['Z'],
+                           entry[plate_name], entry[mjd_name],
+                           entry[fiberid_name], exposures_diff,
+                           reso_in_km_per_s))
 
-                if forest is None:
-                    forest = copy.deepcopy(forest_temp)
-                else:
-                    forest.coadd(forest_temp)
+            forest = forests[0].coadd(forests[1:])
 
             data.append(forest)
 
@@ -1089,6 +1310,12 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
     #    filenames.append(fi)
     filenames = np.unique(filenames)
 
+    # group the catalog rows with respect to their tile, petal and night
+    tile_petal_night = defaultdict(list)
+    for index, key in enumerate(
+            zip(catalog['TILEID'], catalog['PETAL_LOC'], catalog['NIGHT'])):
+        tile_petal_night[key].append(index)
+
     for index, filename in enumerate(filenames):
         userprint("read tile {} of {}. ndata: {}".format(
             index, len(filenames), num_data))
@@ -1098,16 +1325,12 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
             userprint("Error reading file {}\n".format(filename))
             continue
 
-        fibermap = hdul['FIBERMAP'].read()
-        fibermap_colnames = hdul["FIBERMAP"].get_colnames()
-        if 'TARGET_RA' in fibermap_colnames:
-            ra = fibermap['TARGET_RA']
-            dec = fibermap['TARGET_DEC']
-        elif 'RA_TARGET' in fibermap_colnames:
-            ra = fibermap['RA_TARGET']
-            dec = fibermap['DEC_TARGET']
-        ra = np.radians(ra)
-        dec = np.radians(dec)
+        #-- Only read the fibermap columns that are used
+        fibermap_colnames = set(hdul["FIBERMAP"].get_colnames())
+        fibermap = hdul['FIBERMAP'].read(columns=[
+            name for name in ['TARGETID', 'PETAL_LOC', 'TILEID', 'NIGHT']
+            if name in fibermap_colnames
+        ])
 
         petal_spec = fibermap['PETAL_LOC'][0]
 
@@ -1125,6 +1348,11 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
 
         targetid_spec = fibermap['TARGETID']
 
+        #-- Map each targetid to the rows of the file containing it
+        targetid2index = defaultdict(list)
+        for index_spec, targetid in enumerate(targetid_spec):
+            targetid2index[targetid].append(index_spec)
+
         if 'brz_wavelength' in hdul.hdu_map.keys():
             colors = ['BRZ']
             if index == 0:
@@ -1142,8 +1370,8 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
                 spec['log_lambda'] = np.log10(
                     hdul[f'{color}_WAVELENGTH'].read())
                 spec['FL'] = hdul[f'{color}_FLUX'].read()
-                spec['IV'] = (hdul[f'{color}_IVAR'].read() *
-                              (hdul[f'{color}_MASK'].read() == 0))
+                spec['IV'] = hdul[f'{color}_IVAR'].read()
+                spec['IV'] *= (hdul[f'{color}_MASK'].read() == 0)
                 w = np.isnan(spec['FL']) | np.isnan(spec['IV'])
                 for key in ['FL', 'IV']:
                     spec[key][w] = 0.
@@ -1155,9 +1383,8 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
         hdul.close()
         plate_spec = int(f"{tile_spec}{petal_spec}")
 
-        select = ((catalog['TILEID'] == tile_spec) &
-                  (catalog['PETAL_LOC'] == petal_spec) &
-                  (catalog['NIGHT'] == night_spec))
+        key = (tile_spec, petal_spec, night_spec)
+        select = np.array(tile_petal_night.get(key, []), dtype=int)
         userprint(
             f'This is tile {tile_spec}, petal {petal_spec}, night {night_spec}')
 
@@ -1165,7 +1392,7 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
         for entry in catalog[select]:
 
             #-- Find which row in tile contains this quasar
-            w_t = np.where(targetid_spec == entry['TARGETID'])[0]
+            w_t = targetid2index.get(entry['TARGETID'], [])
             if len(w_t) == 0:
                 userprint(f"Error reading {entry['TARGETID']}")
                 continue
@@ -1175,7 +1402,7 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
                 w_t = w_t[0]
 
             #-- Loop over three spectrograph arms and coadd fluxes
-            forest = None
+            forests = []
             for spec in spec_data.values():
                 ivar = spec['IV'][w_t].copy()
                 flux = spec['FL'][w_t].copy()
@@ -1189,15 +1416,13 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
                     reso_in_km_per_s = None
                     exposures_diff = None
 
-                forest_temp = Forest(spec['log_lambda'], flux, ivar,
-                                     entry['TARGETID'], entry['RA'],
-                                     entry['DEC'], entry['Z'], entry['TILEID'],
-                                     entry['NIGHT'], entry['FIBER'],
-                                     exposures_diff, reso_in_km_per_s)
-                if forest is None:
-                    forest = copy.deepcopy(forest_temp)
-                else:
-                    forest.coadd(forest_temp)
+                forests.append(
+                    Forest(spec['log_lambda'], flux, ivar, entry['TARGETID'],
+                           entry['RA'], entry['DEC'], entry['Z'],
+                           entry['TILEID'], entry['NIGHT'], entry['FIBER'],
+                           exposures_diff, reso_in_km_per_s))
+
+            forest = forests[0].coadd(forests[1:])
 
             if plate_spec not in data:
                 data[plate_spec] = []
@@ -1211,6 +1436,25 @@ def read_from_minisv_desi(in_dir, catalog, pk1d=None):
     return data, num_data
 
 
+def read_delta_file(arguments):
+    """Reads the deltas stored in a single file.
+
+    Args:
+        arguments: tuple
+            The name of the file and whether it is in image format
+
+    Returns:
+        List of read deltas
+    """
+    filename, from_image = arguments
+    if from_image:
+        return Delta.from_image(filename)
+    hdul = fitsio.FITS(filename)
+    deltas = [Delta.from_fitsio(hdu) for hdu in hdul[1:]]
+    hdul.close()
+    return deltas
+
+
 def read_deltas(in_dir,
                 nside,
                 lambda_abs,
@@ -1219,7 +1463,8 @@ def read_deltas(in_dir,
                 cosmo,
                 max_num_spec=None,
                 no_project=False,
-                from_image=None):
+                from_image=None,
+                nproc=None):
     """Reads deltas and computes their redshifts.
 
     Fills the fields delta.z and multiplies the weights by
@@ -1249,6 +1494,9 @@ def read_deltas(in_dir,
         from_image: list or None - default: None
             If not None, read the deltas from image files. The list of
             filenname for the image files should be paassed in from_image
+        nproc: int or None - default: None
+            Number of processes used to read the files. If None or 1, the
+            files are read serially
 
     Returns:
         The following variables:
@@ -1261,43 +1509,57 @@ def read_deltas(in_dir,
     Raises:
         AssertionError: if no healpix numbers are found
     """
-    files = []
     in_dir = os.path.expandvars(in_dir)
     if from_image is None or len(from_image) == 0:
-        if len(in_dir) > 8 and in_dir[-8:] == '.fits.gz':
-            files += glob.glob(in_dir)
-        elif len(in_dir) > 5 and in_dir[-5:] == '.fits':
-            files += glob.glob(in_dir)
-        else:
-            files += glob.glob(in_dir + '/*.fits') + glob.glob(in_dir +
-                                                               '/*.fits.gz')
+        paths = [in_dir]
     else:
-        for arg in from_image:
-            if len(arg) > 8 and arg[-8:] == '.fits.gz':
-                files += glob.glob(arg)
-            elif len(arg) > 5 and arg[-5:] == '.fits':
-                files += glob.glob(arg)
-            else:
-                files += glob.glob(arg + '/*.fits') + glob.glob(arg +
-                                                                '/*.fits.gz')
+        paths = from_image
+
+    # paths are expanded with glob (so that they can contain wildcards), and
+    # each matching directory is listed in a single pass looking for both
+    # extensions
+    files = []
+    suffixes = ('.fits', '.fits.gz')
+    for path in paths:
+        if path.endswith(suffixes):
+            files += glob.glob(path)
+            continue
+        for directory in glob.glob(path):
+            if not os.path.isdir(directory):
+                continue
+            files += [
+                entry.path
+                for entry in os.scandir(directory)
+                if entry.name.endswith(suffixes) and
+                not entry.name.startswith('.') and entry.is_file()
+            ]
     files = sorted(files)
 
+    tasks = [(filename, from_image is not None) for filename in files]
+    parallel = nproc is not None and nproc > 1
+    if parallel:
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(processes=nproc)
+        results = pool.imap(read_delta_file, tasks)
+    else:
+        results = map(read_delta_file, tasks)
+
     deltas = []
     num_data = 0
-    for index, filename in enumerate(files):
+    for index, file_deltas in enumerate(results):
         userprint("\rread {} of {} {}".format(index, len(files), num_data))
-        if from_image is None:
-            hdul = fitsio.FITS(filename)
-            deltas += [Delta.from_fitsio(hdu) for hdu in hdul[1:]]
-            hdul.close()
-        else:
-            deltas += Delta.from_image(filename)
+        deltas += file_deltas
 
         num_data = len(deltas)
         if max_num_spec is not None:
             if num_data > max_num_spec:
                 break
 
+    if parallel:
+        # the remaining files are not needed if we stopped early
+        pool.terminate()
+        pool.join()
+
     # truncate the deltas if we load too many lines of sight
     if max_num_spec is not None:
         deltas = deltas[:max_num_spec]
@@ -1305,34 +1567,45 @@ def read_deltas(in_dir,
 
     userprint("\n")
 
-    # compute healpix numbers
-    phi = [delta.ra for delta in deltas]
-    theta = [np.pi / 2. - delta.dec for delta in deltas]
+    # compute healpix numbers (in a single call for all the files)
+    phi = np.array([delta.ra for delta in deltas])
+    theta = np.pi / 2. - np.array([delta.dec for delta in deltas])
     healpixs = healpy.ang2pix(nside, theta, phi)
     if healpixs.size == 0:
         raise AssertionError('ERROR: No data in {}'.format(in_dir))
 
-    data = {}
-    z_min = 10**deltas[0].log_lambda[0] / lambda_abs - 1.
-    z_max = 0.
-    for delta, healpix in zip(deltas, healpixs):
-        z = 10**delta.log_lambda / lambda_abs - 1.
-        z_min = min(z_min, z.min())
-        z_max = max(z_max, z.max())
-        delta.z = z
+    # compute redshifts, distances and weight evolution for all deltas at
+    # once, then split the results back into the individual deltas
+    split_indices = np.cumsum([delta.log_lambda.size for delta in deltas])[:-1]
+    z = 10**np.concatenate([delta.log_lambda for delta in deltas
+                           ]) / lambda_abs - 1.
+    z_min = z.min()
+    z_max = z.max()
+    z_list = np.split(z, split_indices)
+    # ((1 + z) / (1 + z_ref))**(alpha - 1), written with log1p/exp, which is
+    # cheaper than a fractional power
+    weights_factor_list = np.split(
+        np.exp((alpha - 1) * (np.log1p(z) - np.log1p(z_ref))), split_indices)
+    if not cosmo is None:
+        r_comov_list = np.split(cosmo.get_r_comov(z), split_indices)
+        dist_m_list = np.split(cosmo.get_dist_m(z), split_indices)
+
+    data = defaultdict(list)
+    for index, (delta, healpix) in enumerate(zip(deltas, healpixs)):
+        delta.z = z_list[index]
         if not cosmo is None:
-            delta.r_comov = cosmo.get_r_comov(z)
-            delta.dist_m = cosmo.get_dist_m(z)
-        delta.weights *= ((1 + z) / (1 + z_ref))**(alpha - 1)
+            delta.r_comov = r_comov_list[index]
+            delta.dist_m = dist_m_list[index]
+        delta.weights *= weights_factor_list[index]
 
         if not no_project:
             delta.project()
 
-        if not healpix in data:
-            data[healpix] = []
         data[healpix].append(delta)
 
-    return data, num_data, z_min, z_max
+    # convert back to a plain dictionary so that lookups of missing healpixs
+    # downstream do not create new entries
+    return dict(data), num_data, z_min, z_max
 
 
 def read_objects(filename,
@@ -1394,27 +1667,42 @@ def read_objects(filename,
         raise AssertionError()
     userprint("Reading objects ")
 
-    unique_healpix = np.unique(healpixs)
-    for index, healpix in enumerate(unique_healpix):
+    if 'desi' in mode:
+        column_names = [
+            'TARGETID', 'RA', 'DEC', 'Z', 'TILEID', 'NIGHT', 'FIBER'
+        ]
+    else:
+        column_names = [
+            'THING_ID', 'RA', 'DEC', 'Z', 'PLATE', 'MJD', 'FIBERID'
+        ]
+    columns = [catalog[name].data for name in column_names]
+
+    # group the objects by healpix with a single (stable) sort so that they
+    # keep the catalog order within each healpix
+    sort_index = np.argsort(healpixs, kind='stable')
+    unique_healpix, first_index = np.unique(healpixs[sort_index],
+                                            return_index=True)
+    healpix_indexs = np.split(sort_index, first_index[1:])
+
+    # compute weights and distances for all the objects at once
+    z_qso = catalog['Z'].data
+    weights = ((1. + z_qso) / (1. + z_ref))**(alpha - 1.)
+    if not cosmo is None:
+        r_comov = cosmo.get_r_comov(z_qso)
+        dist_m = cosmo.get_dist_m(z_qso)
+
+    for index, (healpix, indexs) in enumerate(
+            zip(unique_healpix, healpix_indexs)):
         userprint("{} of {}".format(index, len(unique_healpix)))
-        w = healpixs == healpix
-        if 'desi' in mode:
-            objs[healpix] = [
-                QSO(entry['TARGETID'], entry['RA'], entry['DEC'], entry['Z'],
-                    entry['TILEID'], entry['NIGHT'], entry['FIBER'])
-                for entry in catalog[w]
-            ]
-        else:
-            objs[healpix] = [
-                QSO(entry['THING_ID'], entry['RA'], entry['DEC'], entry['Z'],
-                    entry['PLATE'], entry['MJD'], entry['FIBERID'])
-                for entry in catalog[w]
-            ]
-        for obj in objs[healpix]:
-            obj.weights = ((1. + obj.z_qso) / (1. + z_ref))**(alpha - 1.)
+        objs[healpix] = [
+            QSO(*values)
+            for values in zip(*[column[indexs] for column in columns])
+        ]
+        for obj, obj_index in zip(objs[healpix], indexs):
+            obj.weights = weights[obj_index]
             if not cosmo is None:
-                obj.r_comov = cosmo.get_r_comov(obj.z_qso)
-                obj.dist_m = cosmo.get_dist_m(obj.z_qso)
+                obj.r_comov = r_comov[obj_index]
+                obj.dist_m = dist_m[obj_index]
 
     return objs, catalog['Z'].min()
 
@@ -1462,12 +1750,12 @@ def read_spall(in_dir, thingid, spall=None):
     plate_spall = spall["PLATE"]
     mjd_spall = spall["MJD"]
     fiberid_spall = spall["FIBERID"]
-    quality_spall = spall["PLATEQUALITY"].astype(str)
     z_warn_spall = spall["ZWARNING"]
 
     w = np.in1d(thingid_spall, thingid)
     userprint(f"INFO: Found {np.sum(w)} spectra with required THING_ID")
-    w &= quality_spall == "good"
+    # only decode the plate quality of the spectra that are kept
+    w[w] = spall["PLATEQUALITY"][w].astype(str) == "good"
     userprint(f"INFO: Found {np.sum(w)} spectra with 'good' plate")
     ## Removing spectra with the following ZWARNING bits set:
     ## SKY, LITTLE_COVERAGE, UNPLUGGED, BAD_TARGET, NODATA
@@ -1479,12 +1767,15 @@ def read_spall(in_dir, thingid, spall=None):
         8: 'BAD_TARGET',
         9: 'NODATA'
     }
+    # the bits are checked in a single pass over the selected spectra
+    z_warn_selected = z_warn_spall[w]
     for z_warn_bit, z_warn_bit_name in bad_z_warn_bit.items():
-        wbit = (z_warn_spall & 2**z_warn_bit == 0)
-        w &= wbit
-        userprint(
-            f"INFO: Found {np.sum(w)} spectra without {z_warn_bit} bit set: {z_warn_bit_name}"
-        )
+        num_bit_set = np.count_nonzero(z_warn_selected & 2**z_warn_bit)
+        userprint(f"INFO: Found {num_bit_set} spectra with {z_warn_bit} bit "
+                  f"set: {z_warn_bit_name}")
+    bad_z_warn_mask = sum(2**z_warn_bit for z_warn_bit in bad_z_warn_bit)
+    w[w] = (z_warn_selected & bad_z_warn_mask) == 0
+    userprint(f"INFO: Found {np.sum(w)} spectra without bad ZWARNING bits set")
     userprint(f"INFO: # unique objs: {len(thingid)}")
     userprint(f"INFO: # spectra: {w.sum()}")
 
@@ -81,8 +81,8 @@ def split_forest(num_parts,
 
         log_lambda_part = log_lambda[selection].copy()
         lambda_abs_igm = constants.ABSORBER_IGM[abs_igm]
-        mean_z = (np.power(10., log_lambda_part[len(log_lambda_part) - 1]) +
-                  np.power(10., log_lambda_part[0])) / 2. / lambda_abs_igm - 1.0
+        mean_z = ((10.**log_lambda_part[-1] + 10.**log_lambda_part[0]) / 2. /
+                  lambda_abs_igm - 1.0)
 
         mean_z_array.append(mean_z)
         log_lambda_array.append(log_lambda_part)
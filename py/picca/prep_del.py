@@ -1,12 +1,14 @@
 """This module defines a set of functions to compute the deltas.
 
-This module provides three functions:
+This module provides four functions:
     - compute_mean_cont
     - compute_var_stats
     - stack
+    - compute_delta
 See the respective documentation for details
 """
 import numpy as np
+from numba import jit
 import iminuit
 from picca.data import Forest
 from picca.utils import userprint
@@ -321,3 +323,54 @@ def stack(data, stack_from_deltas=False):
     stack_delta[w] /= stack_weight[w]
 
     return stack_log_lambda, stack_delta, stack_weight
+
+
+@jit(nopython=True, error_model='numpy')
+def compute_delta(flux, ivar, mean_expected_flux_frac, eta, var_lss, fudge):
+    """Computes the deltas, their weights and their inverse variance.
+
+    All the quantities are computed in a single pass over the pixels.
+    Divisions follow numpy semantics, so that a null mean expected flux
+    fraction gives inf or nan values instead of raising ZeroDivisionError.
+
+    Args:
+        flux: array of floats
+            Flux
+        ivar: array of floats
+            Inverse variance of the flux
+        mean_expected_flux_frac: array of floats
+            Mean expected flux fraction (continuum times stacked transmission)
+        eta: array of floats
+            Correction factor to the contribution of the pipeline estimate of
+            the instrumental noise to the variance.
+        var_lss: array of floats
+            Pixel variance due to the Large Scale Strucure
+        fudge: array of floats
+            Fudge contribution to the variance
+
+    Returns:
+        The following variables:
+            delta: Mean transmission fluctuation
+            weights: Weights of the deltas
+            delta_ivar: Inverse variance of the deltas
+            inv_mean_expected_flux_frac: Inverse of the mean expected flux
+                fraction
+    """
+    num_pixels = flux.size
+    delta = np.empty(num_pixels)
+    weights = np.empty(num_pixels)
+    delta_ivar = np.empty(num_pixels)
+    inv_mean_expected_flux_frac = np.empty(num_pixels)
+    for index in range(num_pixels):
+        inv_frac = 1. / mean_expected_flux_frac[index]
+        delta[index] = flux[index] * inv_frac - 1.
+        ivar_pipe = (ivar[index] * mean_expected_flux_frac[index] *
+                     mean_expected_flux_frac[index])
+        var_pipe = 1. / ivar_pipe
+        variance = (eta[index] * var_pipe + var_lss[index] +
+                    fudge[index] * ivar_pipe)
+        weights[index] = 1. / variance
+        eta_or_one = eta[index] + (1. if eta[index] == 0 else 0.)
+        delta_ivar[index] = ivar_pipe / eta_or_one
+        inv_mean_expected_flux_frac[index] = inv_frac
+    return delta, weights, delta_ivar, inv_mean_expected_flux_frac
@@ -41,21 +41,22 @@ def exp_diff(hdul, log_lambda):
 
     for index_exp in range(num_exp_per_col):
         for index_col in range(2):
-            log_lambda_exp = hdul[(4 + index_exp +
-                                   index_col * num_exp_per_col)]["loglam"][:]
-            flux_exp = hdul[(4 + index_exp +
-                             index_col * num_exp_per_col)]["flux"][:]
-            ivar_exp = hdul[(4 + index_exp +
-                             index_col * num_exp_per_col)]["ivar"][:]
-            mask = hdul[4 + index_exp + index_col * num_exp_per_col]["mask"][:]
+            # read the four columns of the exposure in a single call
+            exposure = hdul[4 + index_exp + index_col * num_exp_per_col].read(
+                columns=["loglam", "flux", "ivar", "mask"])
+            log_lambda_exp = exposure["loglam"]
+            flux_exp = exposure["flux"]
+            ivar_exp = exposure["ivar"]
+            mask = exposure["mask"]
             log_lambda_bins = np.searchsorted(log_lambda, log_lambda_exp)
 
             # exclude masks 25 (COMBINEREJ), 23 (BRIGHTSKY)?
+            good_pixels = (mask & 2**25 == 0)
             rebin_ivar_exp = np.bincount(log_lambda_bins,
-                                         weights=ivar_exp * (mask & 2**25 == 0))
+                                         weights=ivar_exp * good_pixels)
             rebin_flux_exp = np.bincount(log_lambda_bins,
                                          weights=(ivar_exp * flux_exp *
-                                                  (mask & 2**25 == 0)))
+                                                  good_pixels))
 
             if index_exp % 2 == 1:
                 flux_total_odd[:len(rebin_ivar_exp) - 1] += rebin_flux_exp[:-1]
@@ -129,7 +130,8 @@ def spectral_resolution_desi(reso_matrix, log_lambda):
 
     Args:
         reso_matrix: array
-            Resolution matrix
+            Resolution matrix. Leading axes, if any, index different spectra
+            sharing the same wavelength grid
         log_lambda: array or None - default: None
             Logarithm of the wavelength (in Angstroms)
     Returns:
@@ -138,11 +140,12 @@ def spectral_resolution_desi(reso_matrix, log_lambda):
 
     delta_log_lambda = ((log_lambda[-1] - log_lambda[0]) /
                         float(len(log_lambda) - 1))
-    reso = np.clip(reso_matrix, 1.0e-6, 1.0e6)
+    # only the central diagonal and the two below it are needed
+    center = reso_matrix.shape[-2] // 2
+    reso = np.clip(reso_matrix[..., center - 2:center + 1, :], 1.0e-6, 1.0e6)
     rms_in_pixel = (np.sqrt(1.0 / 2.0 / np.log(
-        reso[len(reso) // 2][:] / reso[len(reso) // 2 - 1][:])) + np.sqrt(
-            4.0 / 2.0 / np.log(
-                reso[len(reso) // 2][:] / reso[len(reso) // 2 - 2][:]))) / 2.0
+        reso[..., 2, :] / reso[..., 1, :])) + np.sqrt(
+            4.0 / 2.0 / np.log(reso[..., 2, :] / reso[..., 0, :]))) / 2.0
 
     reso_in_km_per_s = (rms_in_pixel * SPEED_LIGHT * delta_log_lambda *
                         np.log(10.0))
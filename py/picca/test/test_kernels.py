@@ -0,0 +1,231 @@
+'''
+Test module for the compiled kernels and the reduction of partial results
+'''
+import unittest
+import numpy as np
+
+from picca.data import Forest, get_cont_chi2
+from picca.prep_del import compute_delta
+from picca.utils import sum_partial_results
+
+
+def numpy_cont_chi2(p0, p1, flux, log_lambda_offset, log_lambda_range,
+                    mean_cont, ivar, eta, var_lss, fudge,
+                    use_constant_weights):
+    """numpy version of get_cont_chi2 used as reference"""
+    cont_model = (p1 * log_lambda_offset / log_lambda_range + p0) * mean_cont
+    residuals = (flux - cont_model)**2
+    if use_constant_weights:
+        return residuals.sum()
+    var_pipe = 1. / ivar / cont_model**2
+    variance = eta * var_pipe + var_lss + fudge / var_pipe
+    weights = 1.0 / cont_model**2 / variance
+    return (residuals * weights).sum() - np.log(weights).sum()
+
+
+def numpy_delta(flux, ivar, mean_expected_flux_frac, eta, var_lss, fudge):
+    """numpy version of compute_delta used as reference"""
+    inv_mean_expected_flux_frac = 1. / mean_expected_flux_frac
+    delta = flux * inv_mean_expected_flux_frac - 1.
+    var_pipe = inv_mean_expected_flux_frac**2 / ivar
+    variance = eta * var_pipe + var_lss + fudge / var_pipe
+    weights = 1. / variance
+    delta_ivar = ivar / (eta + (eta == 0)) * (mean_expected_flux_frac**2)
+    return delta, weights, delta_ivar, inv_mean_expected_flux_frac
+
+
+class TestKernels(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(42)
+        self._forest_attributes = {
+            attribute: getattr(Forest, attribute) for attribute in [
+                "log_lambda_min", "log_lambda_max",
+                "log_lambda_min_rest_frame", "log_lambda_max_rest_frame",
+                "delta_log_lambda", "get_mean_cont", "get_var_lss",
+                "get_eta", "get_fudge"
+            ]
+        }
+        Forest.log_lambda_min = np.log10(3600.)
+        Forest.log_lambda_max = np.log10(5500.)
+        Forest.log_lambda_min_rest_frame = np.log10(1040.)
+        Forest.log_lambda_max_rest_frame = np.log10(1200.)
+        Forest.delta_log_lambda = 3.e-4
+        Forest.get_var_lss = lambda log_lambda: 0.1 + 0. * log_lambda
+        Forest.get_eta = lambda log_lambda: 1. + 0. * log_lambda
+        Forest.get_fudge = lambda log_lambda: 0.01 + 0. * log_lambda
+
+    def tearDown(self):
+        for attribute, value in self._forest_attributes.items():
+            setattr(Forest, attribute, value)
+
+    def get_forest(self, z_qso=2.5):
+        """Builds a forest with random flux covering the rest-frame range"""
+        log_lambda = (np.log10(1040. * (1. + z_qso)) +
+                      np.arange(200) * Forest.delta_log_lambda)
+        flux = 1. + 0.1 * np.random.normal(size=log_lambda.size)
+        ivar = 100. * np.ones(log_lambda.size)
+        return Forest(log_lambda, flux, ivar, 1, 0., 0., z_qso, 1, 1, 1)
+
+    def get_chi2_args(self, num_pixels=50):
+        """Builds the array arguments of get_cont_chi2"""
+        flux = 1. + 0.1 * np.random.normal(size=num_pixels)
+        log_lambda_offset = np.linspace(0., 0.06, num_pixels)
+        mean_cont = 1. + 0.2 * np.random.random(num_pixels)
+        ivar = 50. + 50. * np.random.random(num_pixels)
+        eta = 1. + 0.1 * np.random.random(num_pixels)
+        var_lss = 0.1 + 0.1 * np.random.random(num_pixels)
+        fudge = 0.01 * np.random.random(num_pixels)
+        return flux, log_lambda_offset, mean_cont, ivar, eta, var_lss, fudge
+
+    def test_cont_chi2(self):
+        flux, log_lambda_offset, mean_cont, ivar, eta, var_lss, fudge = (
+            self.get_chi2_args())
+        for use_constant_weights in [False, True]:
+            for p0, p1 in [(1., 0.), (0.9, 0.2), (1.3, -0.5)]:
+                args = (p0, p1, flux, log_lambda_offset, 0.06, mean_cont,
+                        ivar, eta, var_lss, fudge, use_constant_weights)
+                self.assertTrue(
+                    np.isclose(get_cont_chi2(*args), numpy_cont_chi2(*args),
+                               rtol=1e-12))
+
+    def test_cont_chi2_null_continuum(self):
+        flux, log_lambda_offset, mean_cont, ivar, eta, var_lss, fudge = (
+            self.get_chi2_args())
+        mean_cont[3] = 0.
+        chi2 = get_cont_chi2(1., 0., flux, log_lambda_offset, 0.06, mean_cont,
+                             ivar, eta, var_lss, fudge, False)
+        self.assertTrue(np.isnan(chi2))
+        chi2 = get_cont_chi2(0., 0., flux, log_lambda_offset, 0.06, mean_cont,
+                             ivar, eta, var_lss, fudge, False)
+        self.assertTrue(np.isnan(chi2))
+
+    def test_cont_chi2_extreme_ivar(self):
+        flux, log_lambda_offset, mean_cont, ivar, eta, var_lss, fudge = (
+            self.get_chi2_args())
+        # null fudge on top of an infinite ivar gives a nan variance
+        fudge[9] = 0.
+        for index in [4, 9]:
+            for value in [0., np.inf]:
+                ivar_extreme = ivar.copy()
+                ivar_extreme[index] = value
+                args = (1., 0.1, flux, log_lambda_offset, 0.06, mean_cont,
+                        ivar_extreme, eta, var_lss, fudge, False)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    expected = numpy_cont_chi2(*args)
+                self.assertTrue(
+                    np.allclose(get_cont_chi2(*args), expected, rtol=1e-12,
+                                equal_nan=True))
+
+    def test_cont_fit_null_continuum(self):
+        forest = self.get_forest()
+        forest.order = 1
+        mean_cont = np.ones(forest.log_lambda.size)
+        mean_cont[10] = 0.
+        Forest.get_mean_cont = lambda log_lambda: mean_cont.copy()
+        forest.cont_fit()
+        self.assertIsNotNone(forest.bad_cont)
+        self.assertTrue(np.all(forest.cont == 1e-10))
+
+        forest = self.get_forest()
+        forest.order = 1
+        Forest.get_mean_cont = lambda log_lambda: np.ones(log_lambda.size)
+        forest.cont_fit()
+        self.assertIsNone(forest.bad_cont)
+
+    def get_delta_args(self, num_pixels=50):
+        """Builds the arguments of compute_delta"""
+        flux = 0.8 + 0.1 * np.random.normal(size=num_pixels)
+        ivar = 50. + 50. * np.random.random(num_pixels)
+        mean_expected_flux_frac = 0.7 + 0.2 * np.random.random(num_pixels)
+        eta = 1. + 0.1 * np.random.random(num_pixels)
+        eta[:5] = 0.
+        var_lss = 0.1 + 0.1 * np.random.random(num_pixels)
+        fudge = 0.01 * np.random.random(num_pixels)
+        return flux, ivar, mean_expected_flux_frac, eta, var_lss, fudge
+
+    def assert_same_delta(self, args):
+        """Checks compute_delta against its numpy version"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            expected = numpy_delta(*args)
+        for value, expected_value in zip(compute_delta(*args), expected):
+            self.assertTrue(
+                np.allclose(value, expected_value, rtol=1e-12,
+                            equal_nan=True))
+
+    def test_delta(self):
+        self.assert_same_delta(self.get_delta_args())
+
+    def test_delta_null_flux_frac(self):
+        args = self.get_delta_args()
+        # null mock continuum or null stack value
+        args[2][[10, 17]] = 0.
+        # null flux on top of a null flux fraction gives nan deltas
+        args[0][17] = 0.
+        self.assert_same_delta(args)
+        delta, weights, _, _ = compute_delta(*args)
+        self.assertTrue(np.isinf(delta[10]))
+        self.assertTrue(np.isnan(delta[17]))
+        self.assertEqual(weights[10], 0.)
+
+
+    def test_delta_extreme_ivar(self):
+        args = self.get_delta_args()
+        # null fudge on top of an infinite ivar gives a nan variance
+        args[5][[12, 3]] = 0.
+        for index in [3, 12, 20]:
+            for value in [0., np.inf]:
+                ivar = args[1].copy()
+                ivar[index] = value
+                self.assert_same_delta(args[:1] + (ivar,) + args[2:])
+
+
+    def test_rebin_quantities(self):
+        num_bins = Forest.get_num_bins()
+        bins = np.random.randint(0, num_bins, size=500)
+        bins[:2] = [0, num_bins - 1]
+        ivar = np.random.random(bins.size)
+        flux = np.random.normal(size=bins.size)
+        rebin_ivar, rebin_values = Forest.rebin_quantities(bins, ivar, [flux])
+        self.assertTrue(
+            np.allclose(rebin_ivar,
+                        np.bincount(bins, weights=ivar, minlength=num_bins)))
+        self.assertTrue(
+            np.allclose(
+                rebin_values[0],
+                np.bincount(bins, weights=ivar * flux, minlength=num_bins)))
+
+        # an empty forest gives empty bins
+        rebin_ivar, _ = Forest.rebin_quantities(bins[:0], ivar[:0], [flux[:0]])
+        self.assertTrue(np.all(rebin_ivar == 0.))
+
+    def test_rebin_quantities_out_of_grid(self):
+        num_bins = Forest.get_num_bins()
+        for bad_bin in [-1, num_bins]:
+            bins = np.arange(10)
+            bins[5] = bad_bin
+            with self.assertRaises(ValueError):
+                Forest.rebin_quantities(bins, np.ones(10), [np.ones(10)])
+
+
+    def test_sum_partial_results(self):
+        partial_results = [(np.random.random((3, 4)), np.random.random(4),
+                            np.arange(4), 2.)
+                           for _ in range(5)]
+        copies = [[np.copy(item) for item in partial_result]
+                  for partial_result in partial_results]
+        total = sum_partial_results(iter(partial_results))
+        for index, item in enumerate(total):
+            expected = np.sum([partial_result[index]
+                               for partial_result in copies], axis=0)
+            self.assertTrue(np.allclose(item, expected))
+        self.assertEqual(total[2].dtype, np.arange(4).dtype)
+        self.assertTrue(np.isscalar(total[3]))
+        # the partial results are not modified
+        for partial_result, copy in zip(partial_results, copies):
+            for item, item_copy in zip(partial_result, copy):
+                self.assertTrue(np.all(item == item_copy))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,10 +7,14 @@ These are:
     - smooth_cov_wick
     - compute_ang_max
     - shuffle_distrib_forests
+    - distribute_healpixs
+    - sum_partial_results
+    - to_native_float
     - unred
 See the respective docstrings for more details
 """
 import sys
+import heapq
 import numpy as np
 import fitsio
 import scipy.interpolate as interpolate
@@ -386,6 +390,90 @@ def shuffle_distrib_forests(data, seed):
     return data_shuffled
 
 
+def distribute_healpixs(data, num_processors):
+    """Distributes the healpixs among the CPUs balancing their workload.
+
+    The cost of computing the pairs in a healpix scales roughly as the square
+    of its number of forests. Healpixs are assigned, from the most to the least
+    expensive, to the CPU with the lowest accumulated cost (longest processing
+    time first scheduling).
+
+    Args:
+        data: dict
+            A dictionary with the data. Keys are the healpix numbers of each
+            spectrum. Values are lists of delta instances.
+        num_processors: int
+            Number of CPUs to distribute the healpixs to
+
+    Returns:
+        A dictionary with the healpixs assigned to each CPU. Keys are the CPU
+        numbers. Values are sorted lists of healpix numbers. CPUs with no
+        healpix assigned are not included.
+    """
+    healpixs = sorted(data, key=lambda healpix: -len(data[healpix])**2)
+    loads = [(0, num_processor) for num_processor in range(num_processors)]
+    cpu_data = {}
+    for healpix in healpixs:
+        load, num_processor = heapq.heappop(loads)
+        cpu_data.setdefault(num_processor, []).append(healpix)
+        heapq.heappush(loads,
+                       (load + len(data[healpix])**2, num_processor))
+    for cpu_healpixs in cpu_data.values():
+        cpu_healpixs.sort()
+    return cpu_data
+
+
+def sum_partial_results(partial_results):
+    """Sums the results computed by the different CPUs.
+
+    The partial results are added in place as they arrive, so that only one
+    of them needs to be held in memory at any given time (instead of stacking
+    all of them in a single array before summing).
+
+    Args:
+        partial_results: iterable of tuples
+            Results returned by each of the CPUs (e.g. the output of
+            `Pool.imap`). All the tuples must have the same layout; their items
+            are arrays or scalars.
+
+    Returns:
+        A list with the sum of each of the items in the tuples
+    """
+    total = None
+    for partial_result in partial_results:
+        if total is None:
+            total = [np.array(item) for item in partial_result]
+        else:
+            for total_item, item in zip(total, partial_result):
+                total_item += item
+    return [item[()] if item.ndim == 0 else item for item in total]
+
+
+def to_native_float(array):
+    """Converts an array read from a fits file to native-endian floats.
+
+    Fits files store big-endian data. Arrays that are already double
+    precision are byte-swapped in place and reinterpreted, instead of being
+    copied as `array.astype(float)` would do. Other types are converted to
+    float64.
+
+    Args:
+        array: array
+            The array to convert. It is modified in place if it is a writeable
+            non-native float64 array.
+
+    Returns:
+        A native-endian float64 array with the same values
+    """
+    if array.dtype.kind == "f" and array.dtype.itemsize == 8:
+        if array.dtype.isnative:
+            return array
+        if array.flags.writeable:
+            return array.byteswap(inplace=True).view(
+                array.dtype.newbyteorder())
+    return array.astype(float)
+
+
 # pylint: disable=invalid-name,locally-disabled
 # we keep variable names since this function is adopted from elsewhere
 def unred(wave, ebv, R_V=3.1, LMC2=False, AVGLMC=False):
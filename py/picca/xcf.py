@@ -14,11 +14,13 @@ This module provides several functions:
     - compute_xi_1d
 See the respective docstrings for more details
 """
+from itertools import compress
 import numpy as np
 from healpy import query_disc
 from numba import jit, int32
 
 from picca import constants
+from picca.data import QSO
 from picca.utils import userprint
 
 num_bins_r_par = None
@@ -67,6 +69,10 @@ def fill_neighs(healpixs):
         healpixs: array of ints
             List of healpix numbers
     """
+    # coordinates of the objects in each healpix, gathered once per healpix
+    # and shared by all the deltas querying it
+    healpix_coords = {}
+    healpix_thingids = {}
     for healpix in healpixs:
         for delta in data[healpix]:
             healpix_neighbours = query_disc(
@@ -77,11 +83,27 @@ def fill_neighs(healpixs):
                 other_healpix for other_healpix in healpix_neighbours
                 if other_healpix in objs
             ]
-            neighbours = [
-                obj for other_healpix in healpix_neighbours
-                for obj in objs[other_healpix] if obj.thingid != delta.thingid
-            ]
-            ang = delta.get_angle_between(neighbours)
+            if len(healpix_neighbours) == 0:
+                delta.neighbours = np.array([])
+                continue
+            for other_healpix in healpix_neighbours:
+                if other_healpix not in healpix_coords:
+                    healpix_coords[other_healpix] = QSO.get_coordinates(
+                        objs[other_healpix])
+                    healpix_thingids[other_healpix] = np.array(
+                        [obj.thingid for obj in objs[other_healpix]])
+            w = np.concatenate([
+                healpix_thingids[other_healpix]
+                for other_healpix in healpix_neighbours
+            ]) != delta.thingid
+            neighbours = list(
+                compress((obj for other_healpix in healpix_neighbours
+                          for obj in objs[other_healpix]), w))
+            ang = delta.get_angle_between(
+                np.concatenate([
+                    healpix_coords[other_healpix]
+                    for other_healpix in healpix_neighbours
+                ])[w])
             w = ang < ang_max
             if not ang_correlation:
                 r_comov = np.array([obj.r_comov for obj in neighbours])